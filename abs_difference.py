@@ -4,6 +4,12 @@
 # from a video file specified on the command line
 # (e.g. python FILE.py video_file) or from an attached web camera
 
+# (or, via -m, motion detection by background subtraction using a running
+# average, median, MOG2 or KNN background model on a down-scaled frame)
+
+# (or, via -e, motion events - the bounding box and area of each connected
+# component of the thresholded motion mask written as JSON-lines records)
+
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
 # Copyright (c) 2015 School of Engineering & Computing Science,
@@ -16,6 +22,7 @@
 import cv2
 import argparse
 import sys
+import motion_detection
 
 #####################################################################
 
@@ -39,6 +46,31 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-m",
+    "--method",
+    type=str,
+    choices=("difference",) + motion_detection.methods,
+    help="motion detection method (default: consecutive frame difference)",
+    default="difference")
+parser.add_argument(
+    "-s",
+    "--scale",
+    type=float,
+    help="scale at which background subtraction is performed",
+    default=0.5)
+parser.add_argument(
+    "-e",
+    "--events",
+    type=str,
+    help="write motion events (JSON-lines) to this file",
+    default=None)
+parser.add_argument(
+    "-a",
+    "--min_area",
+    type=int,
+    help="minimum area (in pixels) of a motion event",
+    default=100)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -63,30 +95,33 @@ def nothing(x):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
 window_name = "Live Camera Input"  # window name
 window_name2 = "Difference Image"  # window name
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
+
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create windows by name (as resizable)
 
@@ -104,6 +139,18 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
     threshold = 0
     cv2.createTrackbar("threshold", window_name2, threshold, 255, nothing)
 
+    # set up background subtraction (if specified)
+
+    if (args.method != "difference"):
+        detector = motion_detection.MotionDetector(
+            method=args.method, scale=args.scale)
+
+    # set up motion event output (if specified)
+
+    if (args.events):
+        events = motion_detection.MotionEventWriter(args.events)
+    frame_number = 0
+
     # if video file or camera successfully open then read frame from video
 
     if (cap.isOpened):
@@ -138,6 +185,8 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
                 frame = cv2.resize(
                     frame, (0, 0), fx=args.rescale, fy=args.rescale)
 
+            frame_number += 1
+
         if (use_greyscale):
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
             # if the previous frame we stored also has 3 channels (colour)
@@ -145,6 +194,20 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
                 # convert it, otherwise absdiff() will break
                 prev_frame = cv2.cvtColor(prev_frame, cv2.COLOR_BGR2GRAY)
 
+        # retrieve the threshold setting from the track bar
+
+        threshold = cv2.getTrackbarPos("threshold", window_name2)
+
+        if (args.method != "difference"):
+
+            # motion detection by background subtraction (the threshold
+            # on the difference from the background, where used, is taken
+            # from the track bar if set)
+
+            if (threshold > 0):
+                detector.threshold = threshold
+            motion_mask = detector.apply(frame)
+
         # performing absolute differencing between consecutive frames
 
         diff_img = cv2.absdiff(prev_frame, frame)
@@ -154,19 +217,49 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         contrast = cv2.getTrackbarPos("contrast", window_name2)
 
         # multiple the result to increase the contrast (so we can see small
-        # pixel changes)
+        # pixel changes) - in place with saturation at 255 (rather than the
+        # overflow and wrap around of numpy uint8 multiplication)
+
+        brightened_img = cv2.convertScaleAbs(diff_img, diff_img,
+                                             alpha=contrast)
+
+        # extract motion events from the motion mask (or from the
+        # thresholded difference image) and draw their bounding boxes
 
-        brightened_img = diff_img * contrast
+        if (args.events):
+            if (args.method == "difference"):
+                motion_mask = brightened_img
+                if (len(motion_mask.shape) == 3):
+                    motion_mask = cv2.cvtColor(motion_mask,
+                                               cv2.COLOR_BGR2GRAY)
+                _, motion_mask = cv2.threshold(
+                    motion_mask, 127, 255, cv2.THRESH_BINARY)
 
-        # display images
+            blobs = motion_detection.motion_blobs(motion_mask,
+                                                  min_area=args.min_area)
+            events.emit(frame_number, cap.get(cv2.CAP_PROP_POS_MSEC), blobs)
 
-        cv2.imshow(window_name, frame)
+        # display images (with the motion event bounding boxes drawn on a
+        # copy, such that they are not in the frame kept for differencing)
+
+        display_frame = frame
+        if (args.events):
+            display_frame = frame.copy()
+            for (x, y, w, h, _) in blobs:
+                cv2.rectangle(display_frame, (x, y), (x + w, y + h),
+                              (0, 0, 255), 2)
+
+        cv2.imshow(window_name, display_frame)
 
         # threshold the image if its in grayscale and we have a valid threshold
 
-        threshold = cv2.getTrackbarPos("threshold", window_name2)
+        if (args.method != "difference"):
+
+            # display the motion mask from background subtraction
 
-        if (use_greyscale and (threshold > 0)):
+            cv2.imshow(window_name2, motion_mask)
+
+        elif (use_greyscale and (threshold > 0)):
 
             # display thresholded image if threshold > 0
             # thresholding : if pixel > (threshold value) set to 255 (white),
@@ -219,6 +312,13 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
             # otherwise reside in the same portion of allocated memory)
             prev_frame = frame.copy()
 
+    # write any outstanding motion events
+
+    if (args.events):
+        events.close()
+        if (events.dropped > 0):
+            print("INFO: motion events dropped - " + str(events.dropped))
+
     # close all windows
 
     cv2.destroyAllWindows()
@@ -0,0 +1,331 @@
+##########################################################################
+
+# batch processing of a directory tree of images - each image is processed
+# by a chosen operation (invert, smooth, point transforms, colour query) by
+# a pool of worker processes, each taking chunks of images and prefetching
+# (reading) and writing them via threads to overlap I/O with processing
+
+# output images are written atomically (via a temporary file and rename)
+# and each image completed is recorded in a (JSON-lines) manifest, such
+# that an interrupted batch may be resumed from where it stopped
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as per examples in save_image.py and
+# smooth_image.py:
+
+#    import batch_images
+#    processed, skipped, failed = batch_images.run_batch(
+#        "images/", "output/", "invert")
+
+# or from the command line:
+
+#    python3 batch_images.py -o gamma -p 0.5 images/ output/
+
+# available operations (see operations below): "invert", "smooth", "gamma"
+# and "log" (output images) and "colour" (per image mean colour, recorded
+# in the manifest as the result for each image)
+
+##########################################################################
+
+import cv2
+import argparse
+import concurrent.futures
+import functools
+import json
+import multiprocessing
+import os
+import numpy as np
+import smoothing
+
+##########################################################################
+
+image_extensions = (".bmp", ".jpeg", ".jpg", ".pgm", ".png", ".ppm", ".tif",
+                    ".tiff", ".webp")
+
+manifest_filename = "manifest.jsonl"
+
+##########################################################################
+
+# return the (cached) look up table for a point operation
+
+
+@functools.lru_cache(maxsize=16)
+def point_lut(name, parameter):
+
+    values = np.arange(256, dtype=np.float64) / 255
+    if (name == "gamma"):
+        values = np.power(values, parameter)
+    elif (name == "log"):
+        values = np.log1p(parameter * values) / np.log1p(parameter)
+    return np.clip(np.rint(values * 255), 0, 255).astype(np.uint8)
+
+##########################################################################
+
+# the operations - each returning (output image or None, result or None)
+# with the default parameter of each
+
+
+operations = {
+    "invert": (lambda img, p: (cv2.bitwise_not(img), None), None),
+    "smooth": (lambda img, p: (smoothing.gaussian_blur(
+        img, (5, 5), p), None), 0),
+    "gamma": (lambda img, p: (cv2.LUT(img, point_lut("gamma", p)), None),
+              0.5),
+    "log": (lambda img, p: (cv2.LUT(img, point_lut("log", p)), None), 10.0),
+    "colour": (lambda img, p: (None, [round(v, 2) for v in
+                                      cv2.mean(img)[:img.shape[2]]]), None)
+}
+
+##########################################################################
+
+# return the paths (relative to directory) of all images in the directory
+# tree, in sorted order - excluding the output_dir tree (and its manifest)
+# if this lies within it, such that previous outputs are not re-processed
+
+
+def find_images(directory, output_dir=None):
+
+    exclude = output_dir and os.path.realpath(output_dir)
+    paths = []
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(name for name in dirs if os.path.realpath(
+            os.path.join(root, name)) != exclude)
+        for name in sorted(files):
+            if name.lower().endswith(image_extensions):
+                paths.append(os.path.relpath(os.path.join(root, name),
+                                             directory))
+    return paths
+
+##########################################################################
+
+# read / (atomically) write a file as bytes (as thread tasks)
+
+
+def read_file(path):
+    with open(path, "rb") as image_file:
+        return image_file.read()
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = path + ".tmp" + str(os.getpid())
+    with open(temporary, "wb") as image_file:
+        image_file.write(data)
+    os.replace(temporary, path)
+
+##########################################################################
+
+# process a chunk of images (as a worker task) - returning a manifest
+# record for each image
+
+
+def process_chunk(input_dir, output_dir, paths, operation, parameter,
+                  prefetch=4):
+
+    function = operations[operation][0]
+    records = []
+
+    with concurrent.futures.ThreadPoolExecutor(prefetch) as io_pool:
+
+        # read all of the images of the chunk ahead of processing (in
+        # order) with writes also performed by the same threads
+
+        reads = [io_pool.submit(read_file, os.path.join(input_dir, path))
+                 for path in paths]
+        writes = []
+
+        for path, read in zip(paths, reads):
+            record = {"path": path}
+            try:
+                img = cv2.imdecode(np.frombuffer(read.result(), np.uint8),
+                                   cv2.IMREAD_COLOR)
+                if img is None:
+                    raise ValueError("cannot decode image")
+
+                output, result = function(img, parameter)
+                if output is not None:
+                    ret, encoded = cv2.imencode(os.path.splitext(path)[1],
+                                                output)
+                    if not (ret):
+                        raise ValueError("cannot encode image")
+                    writes.append((record, io_pool.submit(
+                        write_file, os.path.join(output_dir, path),
+                        encoded.tobytes())))
+                if result is not None:
+                    record["result"] = result
+
+            except (IOError, ValueError, cv2.error) as error:
+                record["error"] = str(error)
+            records.append(record)
+
+        for record, write in writes:
+            try:
+                write.result()
+            except IOError as error:
+                record["error"] = str(error)
+
+    return records
+
+##########################################################################
+
+# load the set of image paths already completed (without error) from the
+# manifest (if any)
+
+
+def load_manifest(manifest):
+
+    done = set()
+    if os.path.exists(manifest):
+        with open(manifest, "r") as manifest_file:
+            for line in manifest_file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # (partially written last line)
+                if "error" not in record:
+                    done.add(record["path"])
+    return done
+
+##########################################################################
+
+# set up each worker process - with a single OpenCV thread (as parallelism
+# is provided by the worker processes)
+
+
+def init_worker():
+    cv2.setNumThreads(1)
+
+##########################################################################
+
+# process all images in the input_dir tree with the operation (and its
+# parameter, or the default for the operation) writing the output images
+# to the same relative path in output_dir - using workers processes (or
+# threads) taking chunks of chunk_size images, skipping images already
+# completed in the manifest - returning (processed, skipped, failed)
+
+# by default, worker processes are used only where they are forked (as
+# otherwise each would start by re-importing the calling script, which
+# may have no __main__ guard) or threads otherwise
+
+
+def run_batch(input_dir, output_dir, operation, parameter=None,
+              workers=None, chunk_size=64, prefetch=4, manifest=None,
+              use_processes=None):
+
+    if operation not in operations:
+        raise ValueError('run_batch: unknown operation ' + str(operation)
+                         + ' (not one of ' + str(sorted(operations)) + ')')
+    if parameter is None:
+        parameter = operations[operation][1]
+
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = manifest or os.path.join(output_dir, manifest_filename)
+
+    done = load_manifest(manifest)
+    paths = [path for path in find_images(input_dir, output_dir)
+             if path not in done]
+    chunks = [paths[i:i + chunk_size]
+              for i in range(0, len(paths), chunk_size)]
+
+    workers = workers or os.cpu_count() or 1
+    if (use_processes is None):
+        use_processes = (multiprocessing.get_start_method() == "fork")
+    if (use_processes):
+        pool = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=init_worker)
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(workers)
+
+    processed = failed = 0
+    with pool, open(manifest, "a") as manifest_file:
+
+        # keep (up to) two chunks per worker outstanding, recording the
+        # images of each chunk in the manifest as it is completed
+
+        jobs = set()
+        next_chunk = 0
+        while (next_chunk < len(chunks)) or (len(jobs) > 0):
+            while (next_chunk < len(chunks)) and (len(jobs) < 2 * workers):
+                jobs.add(pool.submit(process_chunk, input_dir, output_dir,
+                                     chunks[next_chunk], operation,
+                                     parameter, prefetch))
+                next_chunk += 1
+
+            completed, jobs = concurrent.futures.wait(
+                jobs, return_when=concurrent.futures.FIRST_COMPLETED)
+            for job in completed:
+                for record in job.result():
+                    manifest_file.write(json.dumps(record) + "\n")
+                    if "error" in record:
+                        failed += 1
+                    else:
+                        processed += 1
+            manifest_file.flush()
+
+    return (processed, len(done), failed)
+
+##########################################################################
+
+# command line usage - process a directory tree with one of the operations
+
+
+if __name__ == "__main__":
+
+    import time
+
+    parser = argparse.ArgumentParser(
+        description='Batch processing of a directory tree of images')
+    parser.add_argument(
+        "-o",
+        "--operation",
+        type=str,
+        choices=sorted(operations),
+        help="operation to apply to each image",
+        default="invert")
+    parser.add_argument(
+        "-p",
+        "--parameter",
+        type=float,
+        help="parameter of the operation (e.g. gamma, sigma)",
+        default=None)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="number of worker processes (default: one per CPU core)",
+        default=None)
+    parser.add_argument(
+        "-cs",
+        "--chunk_size",
+        type=int,
+        help="number of images per chunk of work",
+        default=64)
+    parser.add_argument(
+        'input_dir',
+        metavar='input_dir',
+        type=str,
+        help='specify input directory')
+    parser.add_argument(
+        'output_dir',
+        metavar='output_dir',
+        type=str,
+        help='specify output directory (and manifest location)')
+    args = parser.parse_args()
+
+    start_t = time.time()
+    processed, skipped, failed = run_batch(
+        args.input_dir, args.output_dir, args.operation, args.parameter,
+        workers=args.workers, chunk_size=args.chunk_size,
+        use_processes=True)
+    print("INFO: processed - " + str(processed) + ", skipped (already in "
+          "manifest) - " + str(skipped) + ", failed - " + str(failed)
+          + " in " + str(round(time.time() - start_t, 2)) + " s.")
+
+##########################################################################
@@ -1,7 +1,9 @@
 #####################################################################
 
 # Example : gaussian and bi-lateral filtering on an image from an attached
-# web camera
+# web camera (press "b" to toggle use of the fast approximate bilateral
+# grid filter in place of cv2.bilateralFilter())
+# (optionally, via -m, with quality metrics of the filtered images)
 
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
@@ -15,6 +17,9 @@
 import cv2
 import sys
 import argparse
+import bilateral_grid
+import smoothing
+import image_metrics
 
 #####################################################################
 
@@ -38,6 +43,13 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-m",
+    "--metrics",
+    type=float,
+    help="show PSNR / SSIM / MS-SSIM against the input, computed at this "
+    "scale (e.g. 0.5 for a fast estimate)",
+    default=0)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -46,6 +58,8 @@ parser.add_argument(
     help='specify optional video file')
 args = parser.parse_args()
 
+use_bilateral_grid = False  # toggle approximate bilateral grid filtering
+
 
 #####################################################################
 
@@ -61,19 +75,19 @@ def nothing(x):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
@@ -81,11 +95,14 @@ window_name = "Live Camera Input"  # window name
 window_name2 = "Gaussian Smoothing"  # window name
 window_name3 = "Bilaterial Filtering"  # window name
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
+
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create window by name
 
@@ -93,6 +110,11 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
     cv2.namedWindow(window_name2, cv2.WINDOW_AUTOSIZE)
     cv2.namedWindow(window_name3, cv2.WINDOW_AUTOSIZE)
 
+    # image quality metrics (if specified)
+
+    if (args.metrics > 0):
+        metrics = image_metrics.ImageMetrics(scale=args.metrics, ms_ssim=True)
+
     # add some track bar controllers for settings Gaussian smoothing
 
     neighbourhood = 3
@@ -147,21 +169,32 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         if not (neighbourhood % 2):
             neighbourhood = neighbourhood + 1
 
-        # perform Gaussian smoothing using NxN neighbourhood
+        # perform Gaussian smoothing using NxN neighbourhood (using separable
+        # 1D kernels that are cached between frames for each N and sigma)
 
-        smoothed_img = cv2.GaussianBlur(
+        smoothed_img = smoothing.gaussian_blur(
             frame,
             (neighbourhood,
              neighbourhood),
             sigma,
             sigma,
-            borderType=cv2.BORDER_REPLICATE)
+            border_type=cv2.BORDER_REPLICATE)
+
+        if (use_bilateral_grid):
 
-        # perform bilateral filtering using a neighbourhood calculated
-        # automatically from sigma_s
+            # perform approximate bilateral filtering via a down-sampled
+            # bilateral grid (cost almost independent of sigma_s)
 
-        filtered_img = cv2.bilateralFilter(
-            frame, -1, sigma_r, sigma_s, borderType=cv2.BORDER_REPLICATE)
+            filtered_img = bilateral_grid.bilateral_grid_filter(
+                frame, sigma_r, sigma_s)
+
+        else:
+
+            # perform bilateral filtering using a neighbourhood calculated
+            # automatically from sigma_s
+
+            filtered_img = cv2.bilateralFilter(
+                frame, -1, sigma_r, sigma_s, borderType=cv2.BORDER_REPLICATE)
 
         # display image
 
@@ -169,6 +202,17 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         cv2.imshow(window_name2, smoothed_img)
         cv2.imshow(window_name3, filtered_img)
 
+        # show the quality metrics of the filtered images against the input
+        # (i.e. the extent of the change made by the filter) in the title
+
+        if (args.metrics > 0):
+            metrics.measure(frame, smoothed_img)
+            cv2.setWindowTitle(window_name2,
+                               window_name2 + " - " + metrics.label())
+            metrics.measure(frame, filtered_img)
+            cv2.setWindowTitle(window_name3,
+                               window_name3 + " - " + metrics.label())
+
         # start the event loop - essential
 
         # cv2.waitKey() is a keyboard binding function (argument is the time in
@@ -189,6 +233,14 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         if (key == ord('x')):
             keep_processing = False
 
+        elif (key == ord('b')):
+
+            # toggle bilateral grid filtering (when they press 'b')
+
+            use_bilateral_grid = not (use_bilateral_grid)
+            print("INFO: approximate bilateral grid filtering - "
+                  + str(use_bilateral_grid))
+
     # close all windows
 
     cv2.destroyAllWindows()
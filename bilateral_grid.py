@@ -0,0 +1,242 @@
+##########################################################################
+
+# fast approximate bilateral filtering via a down-sampled bilateral grid
+# (splat -> blur -> slice, vectorised in numpy) whose cost is (almost)
+# independent of the spatial sigma used, unlike cv2.bilateralFilter()
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+# Ref: Paris and Durand, "A Fast Approximation of the Bilateral Filter
+# using a Signal Processing Approach", ECCV 2006 / IJCV 2009.
+# Chen, Paris and Durand, "Real-time Edge-Aware Image Processing with the
+# Bilateral Grid", SIGGRAPH 2007.
+
+##########################################################################
+
+# suggested basic usage - as a drop in for cv2.bilateralFilter() as per
+# the example in bilateral_filter.py:
+
+#    import bilateral_grid
+#    ....
+#    filtered_img = bilateral_grid.bilateral_grid_filter(
+#                       frame, sigma_r, sigma_s)
+
+# in comparison to:
+
+#    filtered_img = cv2.bilateralFilter(frame, -1, sigma_r, sigma_s)
+
+# N.B. the range (edge) term of the grid is computed on the grey-scale
+# luminance of a colour image (as per Chen et al.) rather than on the full
+# colour difference used by cv2.bilateralFilter()
+
+# running this file directly performs an accuracy and speed comparison
+# against cv2.bilateralFilter() - e.g. python3 ./bilateral_grid.py -h
+
+##########################################################################
+
+import cv2
+import argparse
+import numpy as np
+
+##########################################################################
+
+# grid blur kernel (a 5 tap Gaussian with sigma = 1 grid cell) and the
+# padding (in grid cells) needed around the grid to accommodate it
+
+grid_kernel = cv2.getGaussianKernel(5, 1, cv2.CV_32F).ravel()
+grid_padding = len(grid_kernel) // 2
+
+# maximum number of channels passed to OpenCV in a single filter call
+
+max_block_channels = 128
+
+##########################################################################
+
+# separable Gaussian blur of a (rows, cols, depth, channels) grid with zero
+# boundary conditions, performed via cv2.sepFilter2D() on 2D views of it
+
+
+def blur_grid(grid, kernel):
+    rows, cols, depth, channels = grid.shape
+    unit = np.ones((1, 1), np.float32)
+
+    # range (depth) axis - each grid column becomes an image row
+
+    grid = cv2.sepFilter2D(
+        grid.reshape(rows * cols, depth, channels), -1, kernel, unit,
+        borderType=cv2.BORDER_CONSTANT).reshape(rows, cols, depth, channels)
+
+    # spatial axes - the depth and channels become image channels, which
+    # are processed in blocks as OpenCV limits the channel count of a Mat
+
+    grid = grid.reshape(rows, cols, depth * channels)
+    for start in range(0, depth * channels, max_block_channels):
+        block = np.ascontiguousarray(
+            grid[:, :, start:start + max_block_channels])
+        grid[:, :, start:start + max_block_channels] = cv2.sepFilter2D(
+            block, -1, kernel, kernel,
+            borderType=cv2.BORDER_CONSTANT).reshape(block.shape)
+
+    return grid.reshape(rows, cols, depth, channels)
+
+##########################################################################
+
+# perform approximate bilateral filtering of img (grey-scale or colour)
+# with range sigma sigma_r (in intensity levels) and spatial sigma sigma_s
+# (in pixels) - as per sigmaColor / sigmaSpace of cv2.bilateralFilter()
+# - returning an image of the same type (rounded and clipped to the range
+# of integer types, such as 8 or 16-bit, or as is for floating point)
+
+
+def bilateral_grid_filter(img, sigma_r, sigma_s):
+
+    # the grid sampling rates are the sigmas themselves, such that the
+    # grid resolution (and hence the cost of the blur) falls as the sigmas
+    # increase and the splat / slice costs are linear in the pixel count
+    # (with sigma_r at least one intensity level for integer types)
+
+    integer = np.issubdtype(img.dtype, np.integer)
+    sigma_r = max(1.0 if integer else 1e-6, float(sigma_r))
+    sigma_s = max(1.0, float(sigma_s))
+
+    height, width = img.shape[:2]
+    values = img.astype(np.float32).reshape(height, width, -1)
+    channels = values.shape[2]
+
+    # edge (range) guide image - luminance for colour images
+
+    if (channels == 3):
+        guide = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY).astype(np.float32)
+    else:
+        guide = values[:, :, 0]
+
+    # continuous grid coordinates of every pixel
+
+    rows, cols = np.indices((height, width), dtype=np.float32)
+    grid_y = (rows / sigma_s) + grid_padding
+    grid_x = (cols / sigma_s) + grid_padding
+    grid_z = ((guide - guide.min()) / sigma_r) + grid_padding
+
+    grid_shape = (int(np.ceil((height - 1) / sigma_s)) + 1 + 2 * grid_padding,
+                  int(np.ceil((width - 1) / sigma_s)) + 1 + 2 * grid_padding,
+                  int(np.ceil(float(grid_z.max()))) + 1 + grid_padding)
+    grid_cells = grid_shape[0] * grid_shape[1] * grid_shape[2]
+
+    # splat - accumulate the (homogeneous) pixel values into the nearest
+    # grid cell, with the final channel holding the weight (pixel count)
+
+    cell = np.ravel_multi_index(
+        (np.rint(grid_y).astype(np.intp), np.rint(grid_x).astype(np.intp),
+         np.rint(grid_z).astype(np.intp)), grid_shape).ravel()
+
+    grid = np.empty(grid_shape + (channels + 1,), np.float32)
+    for c in range(channels):
+        grid[..., c] = np.bincount(
+            cell, weights=values[:, :, c].ravel(),
+            minlength=grid_cells).reshape(grid_shape)
+    grid[..., channels] = np.bincount(
+        cell, minlength=grid_cells).reshape(grid_shape)
+
+    # blur - separable Gaussian over the three grid dimensions
+
+    grid = blur_grid(grid, grid_kernel)
+
+    # slice - trilinear interpolation of the blurred grid at each pixel,
+    # gathering the 8 surrounding cells via offsets into the flattened grid
+
+    y0 = np.floor(grid_y)
+    x0 = np.floor(grid_x)
+    z0 = np.floor(grid_z)
+    fy = (grid_y - y0).ravel()
+    fx = (grid_x - x0).ravel()
+    fz = (grid_z - z0).ravel()
+    cell = np.ravel_multi_index(
+        (y0.astype(np.intp), x0.astype(np.intp), z0.astype(np.intp)),
+        grid_shape).ravel()
+
+    grid = grid.reshape(grid_cells, channels + 1)
+    stride_y = grid_shape[1] * grid_shape[2]
+    stride_x = grid_shape[2]
+
+    sliced = np.zeros((height * width, channels + 1), np.float32)
+    for dy, wy in ((0, 1 - fy), (stride_y, fy)):
+        for dx, wx in ((0, 1 - fx), (stride_x, fx)):
+            wyx = wy * wx
+            for dz, wz in ((0, 1 - fz), (1, fz)):
+                sliced += ((wyx * wz)[:, np.newaxis]
+                           * np.take(grid, cell + (dy + dx + dz), axis=0))
+
+    # normalise by the interpolated weight and return in the input format
+
+    filtered = sliced[:, :channels] / np.maximum(
+        sliced[:, channels:], 1e-6)
+
+    if (integer):
+        limits = np.iinfo(img.dtype)
+        filtered = np.clip(np.rint(filtered), limits.min, limits.max)
+    return filtered.astype(img.dtype).reshape(img.shape)
+
+##########################################################################
+
+# accuracy and speed comparison harness against cv2.bilateralFilter()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description='Compare bilateral grid filtering against '
+        + 'cv2.bilateralFilter() on an image (accuracy and speed)')
+    parser.add_argument(
+        "-s",
+        "--sigma_s",
+        type=int,
+        nargs='+',
+        help="spatial sigma values to compare",
+        default=[2, 5, 10, 15, 25])
+    parser.add_argument(
+        "-sr",
+        "--sigma_r",
+        type=int,
+        help="range sigma to use",
+        default=10)
+    parser.add_argument(
+        'image_file',
+        metavar='image_file',
+        type=str,
+        nargs='?',
+        help='specify optional image file',
+        default='example.jpg')
+    args = parser.parse_args()
+
+    img = cv2.imread(args.image_file, cv2.IMREAD_COLOR)
+
+    if img is not None:
+
+        print("sigma S | bilateralFilter (ms) | grid (ms) | PSNR (dB)")
+
+        for sigma_s in args.sigma_s:
+
+            start_t = cv2.getTickCount()
+            reference = cv2.bilateralFilter(
+                img, -1, args.sigma_r, sigma_s,
+                borderType=cv2.BORDER_REPLICATE)
+            reference_t = ((cv2.getTickCount() - start_t) /
+                           cv2.getTickFrequency()) * 1000
+
+            start_t = cv2.getTickCount()
+            approximation = bilateral_grid_filter(img, args.sigma_r, sigma_s)
+            approximation_t = ((cv2.getTickCount() - start_t) /
+                               cv2.getTickFrequency()) * 1000
+
+            print("%7d | %20.1f | %9.1f | %9.2f" % (
+                sigma_s, reference_t, approximation_t,
+                cv2.PSNR(reference, approximation)))
+
+    else:
+        print("No image file successfully loaded.")
+
+##########################################################################
@@ -104,19 +104,19 @@ def reset_butterworth_filter(_):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
@@ -125,11 +125,14 @@ window_name2 = "Fourier Magnitude Spectrum"  # window name
 window_name3 = "Filtered Image"  # window name
 window_name4 = "Butterworth Filter"  # window name
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
+
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create windows by name (as resizable)
 
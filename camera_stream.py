@@ -3,6 +3,10 @@
 # threaded frame capture from camera to avoid camera frame buffering delays
 # (always delivers the latest frame from the camera)
 
+# + threaded decode-ahead frame reading from video files, decoding up to K
+# frames ahead of the caller (delivering every frame, in order) such that
+# decoding overlaps with processing
+
 # Copyright (c) 2018-2021 Toby Breckon, Durham University, UK
 # Copyright (c) 2015-2016 Adrian Rosebrock, http://www.pyimagesearch.com
 # MIT License (MIT)
@@ -47,12 +51,22 @@
 #    cap = camera_stream.CameraVideoStream(use_tapi=True)
 # ....
 
+# video file usage - with the same interface (as per example in
+# capture_video.py and all examples given a video file):
+# ....
+#    import camera_stream
+#    cap = camera_stream.VideoFileStream(queue_size=8)
+#    cap.open("video.avi")
+# ....
+#    ret, frame = cap.read()     # ret is False at the end of the video
+
 ##########################################################################
 
 # import the necessary packages
 
 from threading import Thread
 import cv2
+import queue
 import sys
 import atexit
 import logging
@@ -337,3 +351,198 @@ class CameraVideoStream:
         self.suspend = True
 
 ##########################################################################
+
+
+class VideoFileStream:
+    def __init__(self, src=None, backend=None,
+                 name="VideoFileStream", use_tapi=False, queue_size=8):
+
+        # initialize the thread name
+        self.name = name
+
+        # initialize the variables used to indicate if the thread should
+        # be stopped or has reached the end of the video
+        self.stopped = False
+        self.ended = True
+
+        # bounded queue of decoded (frame, timestamp, frame position) in
+        # order, holding at most queue_size frames decoded ahead
+        self.queue_size = max(1, queue_size)
+        self.frames = queue.Queue(maxsize=self.queue_size)
+        self.thread = None
+        self.camera = None
+
+        # set the timestamp / frame position of the last frame read
+        self.timestamp_last_read = 0
+        self.framecounter_last_read = 0
+
+        # set OpenCV Transparent API usage
+        self.tapi = use_tapi
+
+        # if a source was specified at init, proceed to open it
+        if not (src is None):
+            self.open(src, backend)
+
+    def open(self, src=0, backend=None):
+
+        # check if aleady opened via init method
+        if not (self.ended):
+            return True
+
+        # initialize the video file stream (any backend by default)
+        if (backend is None):
+            backend = cv2.CAP_ANY
+        self.camera = cv2.VideoCapture(src, backend)
+
+        # only start the thread if in-fact the video was opened
+        if (self.camera.isOpened()):
+            self._start()
+
+        return not (self.ended)
+
+    def _start(self):
+
+        # create and start the thread to decode frames ahead of the caller
+        self.stopped = False
+        self.ended = False
+        self.thread = Thread(target=self.update, name=self.name, args=())
+
+        #  append thread to global array of threads
+        threadList.append(self.thread)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _stop(self):
+
+        # stop the thread, discarding any frames decoded ahead
+        self.stopped = True
+        while (self.thread is not None) and (self.thread.is_alive()):
+            self._drain()
+            self.thread.join(timeout=0.1)
+        self._drain()
+
+    def _drain(self):
+        try:
+            while True:
+                self.frames.get_nowait()
+        except queue.Empty:
+            pass
+
+    def update(self):
+
+        # keep decoding frames until the end of the video or until the
+        # thread is stopped (or exiting)
+        while not (self.stopped or exitingNow):
+            (grabbed, frame) = self.camera.read()
+            item = (frame, self.camera.get(cv2.CAP_PROP_POS_MSEC),
+                    self.camera.get(cv2.CAP_PROP_POS_FRAMES))
+            if not (grabbed):
+                item = None  # end of video marker
+
+            # wait (if the queue is full) for the caller to read a frame
+            while not (self.stopped or exitingNow):
+                try:
+                    self.frames.put(item, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+
+            if (item is None):
+                logging.info("DECODE - end of video")
+                return
+            logging.info("DECODE - frame %d (%d queued)",
+                         item[2], self.frames.qsize())
+
+    def grab(self):
+        # return whether (potentially) a further frame is available
+        return not (self.ended)
+
+    def retrieve(self):
+        # same as read() in the context of threaded decoding
+        return self.read()
+
+    def read(self):
+
+        # return the next frame in order (waiting for it to be decoded)
+        # or (False, None) at the end of the video
+        if (self.ended) and (self.frames.empty()):
+            return (False, None)
+
+        item = self.frames.get()
+        if (item is None):
+            self.ended = True
+            return (False, None)
+
+        (frame, self.timestamp_last_read, self.framecounter_last_read) = item
+        logging.info("READ - frame %d @ time %f",
+                     self.framecounter_last_read, self.timestamp_last_read)
+
+        if (self.tapi):
+            # return OpenCV Transparent API UMat frame for H/W acceleration
+            return (True, cv2.UMat(frame))
+        # return standard numpy frame
+        return (True, frame)
+
+    def queued(self):
+        # number of frames currently decoded ahead of the caller
+        return self.frames.qsize()
+
+    def isOpened(self):
+        # indicate that the video is open and not yet fully read
+        return not (self.ended) or not (self.frames.empty())
+
+    def release(self):
+        # stop the thread and release the video
+        self._stop()
+        self.ended = True
+        if (self.camera is not None):
+            self.camera.release()
+
+    def set(self, property_name, property_value):
+        # set a video capture property (behavior as per OpenCV manual for
+        # VideoCapture) - stopping the thread, and so discarding the frames
+        # decoded ahead (e.g. when seeking), and then restarting it
+        if (self.camera is None):
+            return False
+        self._stop()
+        ret_val = self.camera.set(property_name, property_value)
+        self._start()
+        return ret_val
+
+    def get(self, property_name):
+        # get a video capture property
+
+        # intercept calls to get the current timestamp or frame position
+        # and explicitly return that of the last image returned to the
+        # caller via read() or retrieve() from this object
+        if (property_name == cv2.CAP_PROP_POS_MSEC):
+            return self.timestamp_last_read
+        elif (property_name == cv2.CAP_PROP_POS_FRAMES):
+            return self.framecounter_last_read
+
+        # default to behavior as per OpenCV manual for
+        # VideoCapture()
+        return self.camera.get(property_name)
+
+    def getBackendName(self):
+        # get a video capture backend (behavior as per OpenCV manual for
+        # VideoCapture)
+        return self.camera.getBackendName()
+
+    def getExceptionMode(self):
+        # get a video capture exception mode (behavior as per OpenCV manual for
+        # VideoCapture)
+        return self.camera.getExceptionMode()
+
+    def setExceptionMode(self, enable):
+        # get a video capture exception mode (behavior as per OpenCV manual for
+        # VideoCapture)
+        return self.camera.setExceptionMode(enable)
+
+    def __del__(self):
+        self.stopped = True
+
+    def __exit__(self, exec_type, exc_value, traceback):
+        self.stopped = True
+
+##########################################################################
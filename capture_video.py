@@ -47,16 +47,32 @@ args = parser.parse_args()
 
 # define video capture object
 
-cap = cv2.VideoCapture()
+try:
+    # to decode video file frames ahead of processing (via a separate thread)
+
+    import camera_stream
+    cap = camera_stream.VideoFileStream(use_tapi=False)
+
+except BaseException:
+    # if not then just use OpenCV default
+
+    print("INFO: camera_stream class not found - video decoding not threaded")
+    cap = cv2.VideoCapture()
 
 # define display window name
 
 window_name = "Live Camera Input"  # window name
 
 # if file is present try to read video_file
-# otherwise default to capture from attached H/W camera
+# otherwise default to capture from attached H/W camera (via the OpenCV
+# default, as decoding frames ahead would only add latency to a camera)
+
+opened = cap.open("video.avi")
+if not (opened):
+    cap = cv2.VideoCapture()
+    opened = cap.open(args.camera_to_use)
 
-if ((cap.open("video.avi")) or (cap.open(args.camera_to_use))):
+if (opened):
 
     # create window by name (as resizable)
 
@@ -4,7 +4,12 @@
 # specified on the command line (e.g. python FILE.py video_file) or from an
 # attached web camera
 
-# N.B. use mouse to select region
+# N.B. use mouse to select region (with -m each selected region is added as
+# a further target to track, with -cs CamShift is used in place of mean
+# shift to also track target scale and orientation, with -roi only the
+# region around each target is converted to HSV and back projected, -hb and
+# -sb set the number of histogram bins and -l the rate at which each target
+# histogram is updated from its tracked region)
 
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
@@ -23,6 +28,7 @@ import argparse
 import sys
 import math
 import numpy as np
+import colour_tracking
 
 #####################################################################
 
@@ -46,6 +52,39 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-m",
+    "--multiple",
+    action='store_true',
+    help="track multiple targets (each selection adds a target)")
+parser.add_argument(
+    "-cs",
+    "--camshift",
+    action='store_true',
+    help="use CamShift (track target scale and orientation)")
+parser.add_argument(
+    "-roi",
+    "--roi_only",
+    action='store_true',
+    help="only process the region around each target (full frame on loss)")
+parser.add_argument(
+    "-hb",
+    "--hue_bins",
+    type=int,
+    help="number of hue histogram bins (e.g. 30)",
+    default=180)
+parser.add_argument(
+    "-sb",
+    "--sat_bins",
+    type=int,
+    help="number of saturation histogram bins (e.g. 32)",
+    default=255)
+parser.add_argument(
+    "-l",
+    "--learning_rate",
+    type=float,
+    help="rate (0 -> 1) of histogram update from the tracked region",
+    default=0.0)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -101,19 +140,19 @@ def nothing(x):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
@@ -121,11 +160,14 @@ window_name = "Live Camera Input"  # window name
 window_name2 = "Hue histogram back projection"  # window name
 window_name_selection = "selected"
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
+
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create window by name (note flags for resizable or not)
 
@@ -149,9 +191,14 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
     cv2.setMouseCallback(window_name, on_mouse, 0)
     cropped = False
 
-    # Setup the termination criteria for search, either 10 iteration or
-    # move by at least 1 pixel pos. difference
-    term_crit = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 1)
+    # set up the tracker manager (holding a hue-saturation histogram and
+    # track window for each target, and keeping the back projection of
+    # each for display)
+
+    tracker = colour_tracking.ColourTrackerManager(
+        use_camshift=args.camshift, keep_backprojection=True,
+        roi_only=args.roi_only, bins=(args.hue_bins, args.sat_bins),
+        learning_rate=args.learning_rate)
 
     while (keep_processing):
 
@@ -194,30 +241,10 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
             if (h > 0) and (w > 0):
                 cropped = True
 
-                # convert region to HSV
-
-                hsv_crop = cv2.cvtColor(crop, cv2.COLOR_BGR2HSV)
-
-                # select all Hue (0-> 180) and Sat. values but eliminate values
-                # with very low saturation or value (due to lack of useful
-                # colour information)
-
-                mask = cv2.inRange(
-                    hsv_crop, np.array(
-                        (0., float(s_lower), float(v_lower))), np.array(
-                        (180., float(s_upper), float(v_upper))))
-
-                # construct a histogram of hue and saturation values and
-                # normalize it
-
-                crop_hist = cv2.calcHist(
-                    [hsv_crop], [
-                        0, 1], mask, [
-                        180, 255], [
-                        0, 180, 0, 255])
-                cv2.normalize(crop_hist, crop_hist, 0, 255, cv2.NORM_MINMAX)
-
-                # set intial position of object
+                # set intial position of object and construct its hue and
+                # saturation histogram, using only values within the S and V
+                # thresholds (replacing any previous target unless tracking
+                # multiple targets)
 
                 track_window = (
                     boxes[0][0],
@@ -227,6 +254,13 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
                     boxes[1][1] -
                     boxes[0][1])
 
+                if not (args.multiple):
+                    tracker.clear()
+                tracker.add_target(
+                    frame, track_window,
+                    lower=(0., float(s_lower), float(v_lower)),
+                    upper=(180., float(s_upper), float(v_upper)))
+
                 cv2.imshow(window_name_selection, crop)
 
             # reset list of boxes
@@ -246,24 +280,22 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
 
         if (cropped):
 
-            # convert incoming image to HSV
-
-            img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-
-            img_bproject = cv2.calcBackProject(
-                [img_hsv], [
-                    0, 1], crop_hist, [
-                    0, 180, 0, 255], 1)
-            cv2.imshow(window_name2, img_bproject)
-
-            # apply meanshift to get the new location
-            ret, track_window = cv2.meanShift(
-                img_bproject, track_window, term_crit)
-
-            # Draw it on image
-            x, y, w, h = track_window
-            frame = cv2.rectangle(
-                frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+            # convert incoming image to HSV once (or, if specified, only the
+            # region around each target), back project each target histogram
+            # within a region around it and apply mean shift (or CamShift) to
+            # get the new location of each
+
+            targets = tracker.update(frame)
+            cv2.imshow(window_name2, tracker.backprojection)
+
+            # Draw them on image
+            for target_id, track_window, rotated_rect in targets:
+                x, y, w, h = track_window
+                frame = cv2.rectangle(
+                    frame, (x, y), (x + w, y + h), (255, 0, 0), 2)
+                if rotated_rect is not None:
+                    box = np.int32(cv2.boxPoints(rotated_rect))
+                    frame = cv2.polylines(frame, [box], True, (0, 255, 0), 2)
 
         else:
 
@@ -11,6 +11,48 @@
 #####################################################################
 
 import cv2
+import argparse
+import sys
+import batch_images
+
+#####################################################################
+
+# parse command line arguments for an (optional) directory tree of images
+# to process in batch
+
+parser = argparse.ArgumentParser(
+    description='Perform ' +
+    sys.argv[0] +
+    ' example operation on an image file (or in batch on a directory tree)')
+parser.add_argument(
+    "-b",
+    "--batch_dir",
+    type=str,
+    help="specify optional directory of images to process in batch",
+    default=None)
+parser.add_argument(
+    "-o",
+    "--output_dir",
+    type=str,
+    help="specify batch output directory (default: colours)",
+    default='colours')
+
+# (any other arguments, as passed to all examples by test_all.sh, are
+# ignored - as before)
+
+args, _ = parser.parse_known_args()
+
+#####################################################################
+
+# batch processing - record the mean colour of every image in the directory
+# tree (in the manifest, output_dir/manifest.jsonl) via a pool of workers
+
+if (args.batch_dir):
+    processed, skipped, failed = batch_images.run_batch(
+        args.batch_dir, args.output_dir, "colour")
+    print("INFO: processed - " + str(processed) + ", skipped - "
+          + str(skipped) + ", failed - " + str(failed))
+    sys.exit(0)
 
 #####################################################################
 
@@ -0,0 +1,290 @@
+##########################################################################
+
+# multiple object colour tracking via mean shift / CamShift - each target
+# has its own hue-saturation histogram and track window, with the frame
+# converted to HSV once per frame and each histogram back projection
+# restricted to a region of interest (ROI) around its target
+
+# + optionally only the ROI of each target (its window expanded by a margin
+# that adapts to its motion) is converted to HSV, reducing the per-frame
+# cost from O(frame) to O(target), with fallback to the full frame for any
+# target that is lost
+
+# + configurable histogram bin quantisation (e.g. 30 x 32 hue-saturation
+# bins in place of 180 x 255) and optional adaptive updating of each target
+# histogram, blended exponentially with that of its tracked region
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+# based in part on tutorial at:
+# http://docs.opencv.org/master/db/df8/tutorial_py_meanshift.html#gsc.tab=0
+
+##########################################################################
+
+# suggested basic usage - as per example in colour_object_tracking.py:
+
+#    import colour_tracking
+#    tracker = colour_tracking.ColourTrackerManager(use_camshift=False,
+#                                                   roi_only=True,
+#                                                   bins=(30, 32),
+#                                                   learning_rate=0.05)
+#    ....
+#    target_id = tracker.add_target(frame, (x, y, w, h),
+#                                   lower=(0, 60, 32), upper=(180, 255, 255))
+#    ....
+#    for (target_id, (x, y, w, h), rotated_rect) in tracker.update(frame):
+#        ....
+
+# (rotated_rect is the CamShift result, as per cv2.CamShift(), or None
+# when using mean shift)
+
+##########################################################################
+
+import cv2
+import numpy as np
+
+##########################################################################
+
+# expand the window (x, y, w, h) by margin (a fraction of its size) plus
+# motion (dx, dy) pixels on each side, clipped to an image of size
+# (height, width)
+
+
+def expand_window(window, margin, height, width, motion=(0, 0)):
+    x, y, w, h = window
+    mx = int(np.ceil((w * margin) + abs(motion[0])))
+    my = int(np.ceil((h * margin) + abs(motion[1])))
+    x0, y0 = max(0, x - mx), max(0, y - my)
+    x1, y1 = min(width, x + w + mx), min(height, y + h + my)
+    return (x0, y0, max(0, x1 - x0), max(0, y1 - y0))
+
+##########################################################################
+
+
+class ColourTarget:
+    def __init__(self, histogram, window, lower, upper):
+
+        # hue-saturation histogram (and the HSV bounds of the pixels it is
+        # constructed from), current track window (x, y, w, h) and
+        # CamShift rotated rectangle (if used)
+
+        self.histogram = histogram
+        self.lower = lower
+        self.upper = upper
+        self.window = window
+        self.rotated_rect = None
+
+        # estimated motion of the window centre (pixels per frame) and
+        # whether the target is currently lost
+
+        self.velocity = (0.0, 0.0)
+        self.lost = False
+
+##########################################################################
+
+
+class ColourTrackerManager:
+    def __init__(self, use_camshift=False, margin=0.5,
+                 keep_backprojection=False, roi_only=False,
+                 loss_threshold=0.1, bins=(180, 255), learning_rate=0.0):
+
+        # use CamShift (scale / orientation) in place of mean shift and the
+        # ROI margin (as a fraction of the track window size) around each
+        # target within which its back projection is computed
+
+        self.use_camshift = use_camshift
+        self.margin = margin
+
+        # convert only the ROI of each target to HSV (rather than the full
+        # frame) and the mean back projection value (0 -> 1) within the
+        # track window below which a target is considered lost (and is then
+        # searched for over the full frame)
+
+        self.roi_only = roi_only
+        self.loss_threshold = loss_threshold
+
+        # hue-saturation histogram bins and ranges - fewer bins give a
+        # smaller (more cache friendly) histogram for back projection
+
+        self.bins = [int(bins[0]), int(bins[1])]
+        self.ranges = [0, 180, 0, 255]
+
+        # rate (0 -> 1) at which each target histogram is blended with that
+        # of its tracked region every frame (0 = no model update)
+
+        self.learning_rate = learning_rate
+
+        # termination criteria for search, either 10 iteration or move by
+        # at least 1 pixel pos. difference
+
+        self.term_crit = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT,
+                          10, 1)
+
+        # targets by target id
+
+        self.targets = {}
+        self.next_id = 0
+
+        # optionally keep a (full frame) image of the ROI back projections
+        # from the last update (for display)
+
+        self.keep_backprojection = keep_backprojection
+        self.backprojection = None
+
+    def add_target(self, frame, window, lower=(0, 60, 32),
+                   upper=(180, 255, 255)):
+
+        # add a target from the region window (x, y, w, h) of the frame,
+        # using only pixels within the HSV lower and upper bounds (to
+        # eliminate values with very low saturation or value due to lack
+        # of useful colour information) - returns the target id
+
+        x, y, w, h = window
+        hsv_crop = cv2.cvtColor(frame[y:y + h, x:x + w], cv2.COLOR_BGR2HSV)
+        lower = np.array(lower, np.float64)
+        upper = np.array(upper, np.float64)
+
+        self.targets[self.next_id] = ColourTarget(
+            self.histogram(hsv_crop, lower, upper), tuple(window),
+            lower, upper)
+        self.next_id += 1
+        return self.next_id - 1
+
+    def histogram(self, hsv_region, lower, upper):
+
+        # construct a (normalized) histogram of hue and saturation values
+        # from the pixels of the HSV region within the lower and upper bounds
+
+        mask = cv2.inRange(hsv_region, lower, upper)
+        histogram = cv2.calcHist([hsv_region], [0, 1], mask, self.bins,
+                                 self.ranges)
+        cv2.normalize(histogram, histogram, 0, 255, cv2.NORM_MINMAX)
+        return histogram
+
+    def remove_target(self, target_id):
+        self.targets.pop(target_id, None)
+
+    def clear(self):
+        self.targets.clear()
+
+    def __len__(self):
+        return len(self.targets)
+
+    def update(self, frame):
+
+        # track all targets into the frame, returning a list of
+        # (target_id, window, rotated_rect) for each target
+
+        height, width = frame.shape[:2]
+        if self.keep_backprojection:
+            self.backprojection = np.zeros((height, width), np.uint8)
+
+        # single (full frame) HSV conversion for all targets, unless only
+        # converting the ROI of each target - in which case it is only
+        # performed if needed for lost targets
+
+        img_hsv = None
+        if not (self.roi_only):
+            img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+        results = []
+        for target_id, target in self.targets.items():
+
+            # ROI - the track window expanded by the margin and the motion
+            # of the target (or the full frame if the target is lost)
+
+            if target.lost:
+                rx, ry, rw, rh = (0, 0, width, height)
+            else:
+                rx, ry, rw, rh = expand_window(target.window, self.margin,
+                                               height, width, target.velocity)
+            if (rw == 0) or (rh == 0):
+                target.lost = True
+                results.append((target_id, target.window, None))
+                continue
+
+            if (img_hsv is None) and (target.lost):
+                img_hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+
+            if img_hsv is not None:
+                roi_hsv = img_hsv[ry:ry + rh, rx:rx + rw]
+            else:
+                roi_hsv = cv2.cvtColor(frame[ry:ry + rh, rx:rx + rw],
+                                       cv2.COLOR_BGR2HSV)
+
+            # back project the target histogram within its ROI only
+
+            img_bproject = cv2.calcBackProject(
+                [roi_hsv], [0, 1], target.histogram, self.ranges, 1)
+
+            if self.keep_backprojection:
+                self.backprojection[ry:ry + rh, rx:rx + rw] = np.maximum(
+                    self.backprojection[ry:ry + rh, rx:rx + rw],
+                    img_bproject)
+
+            # if lost, restart the search from the window sized region with
+            # the strongest back projection over the full frame
+
+            x, y, w, h = target.window
+            if target.lost:
+                w, h = min(w, rw), min(h, rh)
+                _, _, _, (x, y) = cv2.minMaxLoc(cv2.boxFilter(
+                    img_bproject, cv2.CV_32F, (w, h), anchor=(0, 0),
+                    borderType=cv2.BORDER_CONSTANT)[:rh - h + 1,
+                                                    :rw - w + 1])
+
+            # apply mean shift / CamShift (in ROI coordinates) to get the
+            # new location
+
+            roi_window = (x - rx, y - ry, w, h)
+            if self.use_camshift:
+                rotated_rect, roi_window = cv2.CamShift(
+                    img_bproject, roi_window, self.term_crit)
+                (cx, cy), size, angle = rotated_rect
+                target.rotated_rect = ((cx + rx, cy + ry), size, angle)
+            else:
+                _, roi_window = cv2.meanShift(
+                    img_bproject, roi_window, self.term_crit)
+
+            # update the window, its motion and whether the target is lost
+            # (from the mean back projection within the window)
+
+            x, y, w, h = roi_window
+            if (w > 0) and (h > 0):
+                confidence = cv2.mean(
+                    img_bproject[y:y + h, x:x + w])[0] / 255
+                x, y = x + rx, y + ry
+                ox, oy, ow, oh = target.window
+                if not (target.lost):
+                    target.velocity = (
+                        (0.5 * target.velocity[0])
+                        + (0.5 * ((x + (w / 2)) - (ox + (ow / 2)))),
+                        (0.5 * target.velocity[1])
+                        + (0.5 * ((y + (h / 2)) - (oy + (oh / 2)))))
+                else:
+                    target.velocity = (0.0, 0.0)
+                target.window = (x, y, w, h)
+                target.lost = confidence < self.loss_threshold
+
+                # blend the histogram of the tracked region into the target
+                # histogram (at a cost proportional to the window size)
+
+                if (self.learning_rate > 0) and not (target.lost):
+                    cv2.addWeighted(
+                        target.histogram, 1.0 - self.learning_rate,
+                        self.histogram(
+                            roi_hsv[y - ry:y - ry + h, x - rx:x - rx + w],
+                            target.lower, target.upper),
+                        self.learning_rate, 0, dst=target.histogram)
+            else:
+                target.lost = True
+
+            results.append((target_id, target.window, target.rotated_rect))
+
+        return results
+
+##########################################################################
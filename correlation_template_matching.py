@@ -4,7 +4,13 @@
 # specified on the command line (e.g. python FILE.py video_file) or from an
 # attached web camera
 
-# N.B. use mouse to select region
+# N.B. use mouse to select region (press "p" to toggle coarse to fine
+# image pyramid search, over the template scales specified via -s, and "t"
+# to toggle tracking by matching around the previous match location, and
+# "f" to force FFT based correlation for all templates - otherwise used
+# automatically for large templates only;
+# press "a" to add the selected region to a bank of templates that are all
+# matched in every frame, and "c" to clear this bank)
 
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
@@ -22,6 +28,7 @@ import argparse
 import sys
 import math
 import numpy as np
+import template_matching
 
 #####################################################################
 
@@ -45,6 +52,26 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-s",
+    "--scales",
+    type=float,
+    nargs='+',
+    help="template scales to search over in image pyramid search mode",
+    default=[1.0])
+parser.add_argument(
+    "-t",
+    "--threshold",
+    type=float,
+    help="match confidence threshold below which tracking searches the "
+    + "full frame",
+    default=0.6)
+parser.add_argument(
+    "-b",
+    "--bank_threshold",
+    type=float,
+    help="minimum correlation of matches for templates in the bank",
+    default=0.8)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -55,6 +82,9 @@ args = parser.parse_args()
 
 
 selection_in_progress = False  # support interactive region selection
+use_pyramid = False  # toggle coarse to fine image pyramid search
+use_tracking = False  # toggle tracking by matching around previous match
+force_fft = False  # toggle FFT correlation for all (not just large) templates
 
 #####################################################################
 
@@ -91,19 +121,19 @@ def on_mouse(event, x, y, flags, params):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
@@ -111,11 +141,14 @@ window_name = "Live Camera Input"  # window name
 window_name2 = "Correlation Output"  # window name
 window_name_selection = "selected"
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
+
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create window by name (note flags for resizable or not)
 
@@ -128,6 +161,10 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
     cv2.setMouseCallback(window_name, on_mouse, 0)
     cropped = False
 
+    # bank of templates (sharing the frame spectrum for FFT based matching)
+
+    bank = template_matching.TemplateBank(threshold=args.bank_threshold)
+
     # usage
 
     print("USAGE: click and drag left to right to select an image region")
@@ -167,6 +204,23 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
                 cropped = True
                 cv2.imshow(window_name_selection, crop)
 
+                # (re)initialise tracking for the new template - searching
+                # the full frame via the image pyramid on start up / loss
+
+                tracker = template_matching.TemplateTracker(
+                    crop, threshold=args.threshold,
+                    full_search=template_matching.pyramid_match)
+
+                # set up FFT based correlation for the new template (caching
+                # its spectrum, if it is large enough to benefit from this)
+
+                correlator = template_matching.FFTCorrelator(crop)
+
+        # match all templates in the bank (after non-maximum suppression) -
+        # on the frame before anything is drawn on it
+
+        bank_matches = bank.match(frame)
+
         # interactive display of selection box
 
         if (selection_in_progress):
@@ -179,8 +233,40 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         # if we have cropped a region perform template matching using
         # (normalized) cross correlation and draw rectangle around best match
 
-        if cropped:
-            correlation = cv2.matchTemplate(frame, crop, cv2.TM_CCOEFF_NORMED)
+        if cropped and use_tracking:
+
+            # search only a window around the previous match (sized by the
+            # estimated target velocity) unless the match confidence drops
+
+            max_val, max_loc, found = tracker.track(frame)
+            if found:
+                h, w, c = crop.shape   # size of template
+                top_left = max_loc
+                bottom_right = (top_left[0] + w, top_left[1] + h)
+                cv2.rectangle(frame, top_left, bottom_right, (0, 0, 255), 2)
+
+        elif cropped and use_pyramid:
+
+            # search the coarsest image pyramid level in full and refine the
+            # match within a small window at each finer level (for each of
+            # the template scales) - no full correlation output is computed
+
+            max_val, max_loc, scale, (w, h) = \
+                template_matching.multi_scale_match(frame, crop, args.scales)
+            if max_loc is not None:
+                top_left = max_loc
+                bottom_right = (top_left[0] + w, top_left[1] + h)
+                cv2.rectangle(frame, top_left, bottom_right, (0, 0, 255), 2)
+
+        elif cropped:
+
+            # correlate via the FFT for large templates, or spatially via
+            # cv2.matchTemplate() otherwise (unless FFT is forced)
+
+            if force_fft:
+                correlation = correlator.match(frame, use_fft=True)
+            else:
+                correlation = correlator.match(frame)
             min_val, max_val, min_loc, max_loc = cv2.minMaxLoc(correlation)
             h, w, c = crop.shape   # size of template
             top_left = max_loc     # top left of template matching image frame
@@ -189,6 +275,11 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
 
             cv2.imshow(window_name2, correlation)
 
+        # draw rectangles around every match of the templates in the bank
+
+        for template_id, max_val, (x, y, w, h) in bank_matches:
+            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 255), 2)
+
         # display image
 
         cv2.imshow(window_name, frame)
@@ -221,6 +312,43 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         if (key == ord('x')):
             keep_processing = False
 
+        elif (key == ord('p')):
+
+            # toggle image pyramid search (when they press 'p')
+
+            use_pyramid = not (use_pyramid)
+            print("INFO: image pyramid search - " + str(use_pyramid))
+
+        elif (key == ord('t')):
+
+            # toggle tracking by matching (when they press 't')
+
+            use_tracking = not (use_tracking)
+            print("INFO: tracking by matching - " + str(use_tracking))
+
+        elif (key == ord('f')):
+
+            # toggle forcing FFT based correlation for all templates (when
+            # they press 'f')
+
+            force_fft = not (force_fft)
+            print("INFO: FFT based correlation (forced) - " + str(force_fft))
+
+        elif (key == ord('a')) and cropped:
+
+            # add the selected region to the template bank (when they
+            # press 'a')
+
+            bank.add(crop)
+            print("INFO: templates in bank - " + str(len(bank)))
+
+        elif (key == ord('c')):
+
+            # clear the template bank (when they press 'c')
+
+            bank.clear()
+            print("INFO: templates in bank - " + str(len(bank)))
+
     # close all windows
 
     cv2.destroyAllWindows()
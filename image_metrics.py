@@ -0,0 +1,256 @@
+##########################################################################
+
+# image quality metrics - PSNR, SSIM and MS-SSIM of a processed image (e.g.
+# filtered or compressed) against its reference, with the SSIM local
+# statistics computed via separable Gaussian windows (cv2.sepFilter2D())
+# into working buffers that are allocated once and then re-used for every
+# frame of the same size - PSNR is computed over all of the channels of
+# the images, and SSIM / MS-SSIM on their luminance (luma) only
+
+# optionally, both images are first downsampled (scale < 1) for a fast
+# estimate of each metric, such that quality can be tracked per frame in
+# real-time alongside the processing
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+# Ref: Wang et al., "Image quality assessment: from error visibility to
+# structural similarity", IEEE Trans. Image Processing, 13(4), 2004.
+
+# Ref: Wang, Simoncelli and Bovik, "Multiscale structural similarity for
+# image quality assessment", Asilomar Conf. on Signals, Systems and
+# Computers, 2003.
+
+##########################################################################
+
+# suggested basic usage - as per examples in jpeg_compression_noise.py and
+# the filtering examples (e.g. nlm_filter.py):
+
+#    import image_metrics
+#    metrics = image_metrics.ImageMetrics(scale=0.5, ms_ssim=True)
+#    ....
+#    psnr, ssim, ms_ssim = metrics.measure(frame, processed)
+#    print(metrics.label())  # e.g. "PSNR 34.2 dB, SSIM (luma) 0.912, ..."
+
+##########################################################################
+
+import cv2
+import numpy as np
+import smoothing
+
+##########################################################################
+
+# MS-SSIM weights for each scale (finest first) - as per Wang et al. 2003
+
+ms_ssim_weights = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+
+##########################################################################
+
+# the working buffers (all float32) for the SSIM of one image size
+
+
+class SSIMBuffers:
+    def __init__(self, height, width):
+        shape = (height, width)
+        self.x = np.zeros(shape, np.float32)      # reference
+        self.y = np.zeros(shape, np.float32)      # processed image
+        self.mu_x = np.zeros(shape, np.float32)   # local means
+        self.mu_y = np.zeros(shape, np.float32)
+        self.xx = np.zeros(shape, np.float32)     # local (co)variances
+        self.yy = np.zeros(shape, np.float32)
+        self.xy = np.zeros(shape, np.float32)
+        self.cs = np.zeros(shape, np.float32)     # contrast-structure map
+        self.t = np.zeros(shape, np.float32)      # temporary
+
+##########################################################################
+
+
+class ImageMetrics:
+    def __init__(self, scale=1.0, sigma=1.5, ksize=11, ms_ssim=False,
+                 data_range=255):
+
+        # scale at which the metrics are computed (< 1 for a fast estimate),
+        # the Gaussian window (sigma and kernel size) of the SSIM local
+        # statistics and whether MS-SSIM is also computed
+
+        self.scale = scale
+        self.data_range = data_range
+        self.kernel = smoothing.gaussian_kernel(ksize, sigma)
+        self.ksize = self.kernel.shape[0]
+        self.use_ms_ssim = ms_ssim
+
+        # SSIM stabilising constants for the data range of the images
+
+        self.c1 = (0.01 * data_range) ** 2
+        self.c2 = (0.03 * data_range) ** 2
+
+        # working buffers for each image size (the downsampled images and
+        # each MS-SSIM scale)
+
+        self.resized = {}
+        self.buffers = {}
+
+        # metrics for the last pair of images measured and the time taken
+
+        self.psnr = 0
+        self.ssim = 0
+        self.ms_ssim = None
+        self.latency_ms = 0
+
+    def _buffers(self, height, width):
+
+        # return the (re-used) buffers for the image size - discarding all
+        # buffers if the size of the input keeps changing
+
+        if (height, width) not in self.buffers:
+            if (len(self.buffers) > 16):
+                self.buffers.clear()
+            self.buffers[(height, width)] = SSIMBuffers(height, width)
+        return self.buffers[(height, width)]
+
+    def _resize(self, img, index):
+
+        # downsample the image to the measurement scale (into a re-used
+        # buffer, one for each of the two images)
+
+        height, width = img.shape[:2]
+        size = (max(1, int(round(width * self.scale))),
+                max(1, int(round(height * self.scale))))
+        key = (index, size, img.shape[2:], img.dtype)
+        if key not in self.resized:
+            if (len(self.resized) > 16):
+                self.resized.clear()
+            self.resized[key] = np.zeros(
+                (size[1], size[0]) + img.shape[2:], img.dtype)
+        return cv2.resize(img, size, dst=self.resized[key],
+                          interpolation=cv2.INTER_AREA)
+
+    def _grey(self, img, dst):
+
+        # convert to grey-scale (luminance) as float32 into dst
+
+        if (len(img.shape) == 3) and (img.shape[2] > 1):
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        np.copyto(dst, img.reshape(dst.shape), casting="unsafe")
+
+    def _blur(self, src, dst):
+        return cv2.sepFilter2D(src, cv2.CV_32F, self.kernel, self.kernel,
+                               dst=dst, borderType=cv2.BORDER_REFLECT)
+
+    def _valid(self, img):
+
+        # the region of the image for which the Gaussian window lies wholly
+        # within the image (where the image is large enough)
+
+        r = self.ksize // 2
+        if (img.shape[0] > (2 * r)) and (img.shape[1] > (2 * r)):
+            return img[r:-r, r:-r]
+        return img
+
+    def _ssim(self, b):
+
+        # return the (mean) SSIM and contrast-structure of the images in the
+        # buffers x and y (re-using the other buffers for all intermediate
+        # results)
+
+        self._blur(b.x, b.mu_x)
+        self._blur(b.y, b.mu_y)
+        self._blur(cv2.multiply(b.x, b.x, dst=b.t), b.xx)
+        self._blur(cv2.multiply(b.y, b.y, dst=b.t), b.yy)
+        self._blur(cv2.multiply(b.x, b.y, dst=b.t), b.xy)
+
+        # local variances and covariance (e.g. E[x^2] - E[x]^2)
+
+        cv2.subtract(b.xx, cv2.multiply(b.mu_x, b.mu_x, dst=b.t), dst=b.xx)
+        cv2.subtract(b.yy, cv2.multiply(b.mu_y, b.mu_y, dst=b.t), dst=b.yy)
+        cv2.subtract(b.xy, cv2.multiply(b.mu_x, b.mu_y, dst=b.t), dst=b.xy)
+
+        # contrast-structure (2 cov + C2) / (var_x + var_y + C2)
+
+        cv2.addWeighted(b.xy, 2.0, b.xy, 0.0, self.c2, dst=b.xy)
+        cv2.addWeighted(b.xx, 1.0, b.yy, 1.0, self.c2, dst=b.xx)
+        cv2.divide(b.xy, b.xx, dst=b.cs)
+
+        # luminance (2 mu_x mu_y + C1) / (mu_x^2 + mu_y^2 + C1) (with
+        # mu_x mu_y still held in t)
+
+        cv2.addWeighted(b.t, 2.0, b.t, 0.0, self.c1, dst=b.t)
+        cv2.multiply(b.mu_x, b.mu_x, dst=b.mu_x)
+        cv2.multiply(b.mu_y, b.mu_y, dst=b.mu_y)
+        cv2.addWeighted(b.mu_x, 1.0, b.mu_y, 1.0, self.c1, dst=b.mu_x)
+        cv2.divide(b.t, b.mu_x, dst=b.t)
+
+        cs = cv2.mean(self._valid(b.cs))[0]
+        ssim = cv2.mean(self._valid(cv2.multiply(b.t, b.cs, dst=b.t)))[0]
+        return (ssim, cs)
+
+    def _ms_ssim(self, b, ssim, cs):
+
+        # MS-SSIM - from the SSIM and contrast-structure at the finest scale
+        # (as already computed), the contrast-structure at each of the finer
+        # scales and the SSIM at the coarsest, with the images halved in
+        # size (2 x 2 mean) between scales, for as many scales as the image
+        # size permits (with the weights re-normalised if fewer)
+
+        values = []
+        for weight in ms_ssim_weights[:-1]:
+            height, width = b.x.shape[:2]
+            if (min(height, width) // 2) < self.ksize:
+                break
+            values.append(max(0.0, cs))
+
+            size = (width // 2, height // 2)
+            b_next = self._buffers(size[1], size[0])
+            cv2.resize(b.x, size, dst=b_next.x, interpolation=cv2.INTER_AREA)
+            cv2.resize(b.y, size, dst=b_next.y, interpolation=cv2.INTER_AREA)
+            b = b_next
+            ssim, cs = self._ssim(b)
+        values.append(max(0.0, ssim))
+
+        weights = np.array(ms_ssim_weights[:len(values)])
+        return float(np.prod(np.power(values, weights / weights.sum())))
+
+    def measure(self, reference, img):
+
+        # return (PSNR, SSIM, MS-SSIM or None) of img against the reference
+        # (of the same size and type) - also kept as attributes - with PSNR
+        # over all channels (and infinite for identical images, rather than
+        # the 361 dB returned by cv2.PSNR()) and SSIM / MS-SSIM on luma
+
+        start_t = cv2.getTickCount()
+
+        if (self.scale != 1.0):
+            reference = self._resize(reference, 0)
+            img = self._resize(img, 1)
+
+        if (cv2.norm(reference, img, cv2.NORM_INF) == 0):
+            self.psnr = float("inf")
+        else:
+            self.psnr = cv2.PSNR(reference, img, self.data_range)
+
+        b = self._buffers(*reference.shape[:2])
+        self._grey(reference, b.x)
+        self._grey(img, b.y)
+
+        self.ssim, cs = self._ssim(b)
+        self.ms_ssim = None
+        if (self.use_ms_ssim):
+            self.ms_ssim = self._ms_ssim(b, self.ssim, cs)
+
+        self.latency_ms = ((cv2.getTickCount() - start_t)
+                           / cv2.getTickFrequency()) * 1000
+        return (self.psnr, self.ssim, self.ms_ssim)
+
+    def label(self):
+
+        # the last metrics measured as text (e.g. for display)
+
+        text = "PSNR %.1f dB, SSIM (luma) %.3f" % (self.psnr, self.ssim)
+        if self.ms_ssim is not None:
+            text += ", MS-SSIM (luma) %.3f" % self.ms_ssim
+        return text + " (%.1f ms)" % self.latency_ms
+
+##########################################################################
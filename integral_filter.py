@@ -0,0 +1,183 @@
+##########################################################################
+
+# mean (box) filtering via integral images (summed area tables) - the table
+# is computed once per frame and then any rectangular window mean (or any
+# NxN mean filtered image) is obtained at O(1) cost per pixel irrespective
+# of the size of the window used
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as per example in mean_filter.py:
+
+#    import integral_filter
+#    box = integral_filter.IntegralImageFilter(max_neighbourhood=25)
+#    ....
+#    box.set_image(frame)                  # once per frame
+#    mean_3 = box.mean(3)                  # 3x3 mean filtered image
+#    mean_15 = box.mean(15)                # 15x15 from the same table
+#    region_mean = box.window_mean(x, y, w, h)
+#    local_var = box.variance(7)           # if created with squares=True
+
+# for window sizes up to max_neighbourhood the output of mean() matches
+# that of cv2.blur(frame, (N, N), borderType=cv2.BORDER_DEFAULT) as the
+# frame is border padded (once) by that amount before the table is built
+
+##########################################################################
+
+import cv2
+import numpy as np
+
+##########################################################################
+
+
+class IntegralImageFilter:
+    def __init__(self, max_neighbourhood=25, squares=False):
+
+        # largest NxN neighbourhood that will be requested via mean() - this
+        # sets the border padding applied before building the table
+
+        self.max_neighbourhood = max(1, int(max_neighbourhood))
+        self.pad = self.max_neighbourhood // 2
+
+        # also build the table of squared values (for local variance)
+
+        self.squares = squares
+
+        # set these to null values initially
+
+        self.sat = None
+        self.sqsat = None
+        self.shape = None
+        self.dtype = None
+
+    def set_image(self, img):
+
+        # remember the input dimensions / type so that filtered images are
+        # returned in the same format as the input
+
+        self.shape = img.shape
+        self.dtype = img.dtype
+
+        # pad the image (as per the default border of cv2.blur()) so that
+        # every neighbourhood up to max_neighbourhood lies inside the table
+
+        padded = cv2.copyMakeBorder(img, self.pad, self.pad,
+                                    self.pad, self.pad, cv2.BORDER_DEFAULT)
+
+        # compute the integral image(s) - these have an extra leading row
+        # and column of zeros such that sat[y, x] = sum(img[0:y, 0:x])
+
+        if (self.squares):
+            self.sat, self.sqsat = cv2.integral2(
+                padded, sdepth=cv2.CV_64F, sqdepth=cv2.CV_64F)
+        else:
+            self.sat = cv2.integral(padded, sdepth=cv2.CV_64F)
+            self.sqsat = None
+
+        # ensure a consistent (height, width, channels) layout
+
+        if (self.sat.ndim == 2):
+            self.sat = self.sat[:, :, np.newaxis]
+            if (self.sqsat is not None):
+                self.sqsat = self.sqsat[:, :, np.newaxis]
+
+    def _box_sum(self, table, neighbourhood):
+
+        # sum over the NxN neighbourhood (anchored at its centre as per
+        # cv2.blur()) of every pixel of the original image, computed using
+        # four vectorised lookups into the table
+
+        if (table is None):
+            raise ValueError('IntegralImageFilter: no image set')
+        if not (1 <= neighbourhood <= self.max_neighbourhood):
+            raise ValueError('IntegralImageFilter: neighbourhood must be '
+                             + 'in the range 1 to max_neighbourhood')
+
+        height, width = self.shape[:2]
+        before = neighbourhood // 2
+        after = neighbourhood - before
+        top = self.pad - before
+        left = self.pad - before
+        bottom = self.pad + after
+        right = self.pad + after
+
+        return (table[bottom:bottom + height, right:right + width]
+                - table[top:top + height, right:right + width]
+                - table[bottom:bottom + height, left:left + width]
+                + table[top:top + height, left:left + width])
+
+    def _to_image(self, values):
+
+        # convert a (height, width, channels) float result back to the
+        # dimensions and type of the input image (with rounding)
+
+        if (len(self.shape) == 2):
+            values = values[:, :, 0]
+        if (np.issubdtype(self.dtype, np.integer)):
+            info = np.iinfo(self.dtype)
+            values = np.clip(np.rint(values), info.min, info.max)
+        return values.astype(self.dtype)
+
+    def mean(self, neighbourhood):
+
+        # return the NxN mean filtered image
+
+        box_sum = self._box_sum(self.sat, neighbourhood)
+        return self._to_image(box_sum * (1.0 / (neighbourhood ** 2)))
+
+    def means(self, neighbourhoods):
+
+        # return a list of mean filtered images, one per NxN neighbourhood
+        # (all served from the same table)
+
+        return [self.mean(n) for n in neighbourhoods]
+
+    def variance(self, neighbourhood):
+
+        # return the NxN local variance of the image (as floating point)
+
+        if not (self.squares):
+            raise ValueError('IntegralImageFilter: variance() requires '
+                             + 'squares=True')
+
+        area = 1.0 / (neighbourhood ** 2)
+        mean = self._box_sum(self.sat, neighbourhood) * area
+        sq_mean = self._box_sum(self.sqsat, neighbourhood) * area
+        variance = np.maximum(sq_mean - (mean * mean), 0)
+
+        if (len(self.shape) == 2):
+            return variance[:, :, 0]
+        return variance
+
+    def window_mean(self, x, y, w, h):
+
+        # return the mean value (per channel) of an arbitrary rectangular
+        # window (x, y, w, h) within the original image (clipped to it)
+
+        if (self.sat is None):
+            raise ValueError('IntegralImageFilter: no image set')
+
+        height, width = self.shape[:2]
+        x0 = min(max(0, x), width)
+        y0 = min(max(0, y), height)
+        x1 = min(max(0, x + w), width)
+        y1 = min(max(0, y + h), height)
+        area = (x1 - x0) * (y1 - y0)
+        if (area == 0):
+            return np.zeros(self.sat.shape[2])
+
+        # offset into the padded table
+
+        x0, x1, y0, y1 = (x0 + self.pad, x1 + self.pad,
+                          y0 + self.pad, y1 + self.pad)
+
+        return ((self.sat[y1, x1] - self.sat[y0, x1]
+                 - self.sat[y1, x0] + self.sat[y0, x0]) / area)
+
+##########################################################################
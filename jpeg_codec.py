@@ -0,0 +1,350 @@
+##########################################################################
+
+# JPEG encode / decode service - JPEG compression round trips (encode,
+# decode and the resulting PSNR) are performed on a pool of threads (as
+# OpenCV releases the Python GIL whilst encoding / decoding), such that a
+# sweep over a set of quality levels for the same frame is evaluated in
+# parallel, returning the compressed size and PSNR at each level (for
+# rate-distortion analysis at video rate)
+
+# + rate controlled JPEG encoding - the quality of each frame is chosen to
+# meet a target size in bytes per frame, via a bisection search on quality
+# seeded from a (cached) model of size against quality for the scene, such
+# that most frames need only a single encode
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as per example in jpeg_compression_noise.py:
+
+#    import jpeg_codec
+#    codec = jpeg_codec.JPEGCodec(workers=4)
+#    ....
+#    jpeg_img, size, psnr = codec.round_trip(frame, quality=90)
+#    ....
+#    for (quality, size, psnr) in codec.quality_sweep(frame,
+#                                                     range(10, 101, 10)):
+#        ....
+#    codec.close()
+
+# rate controlled usage (e.g. 20 KB per frame):
+
+#    encoder = jpeg_codec.RateControlledJPEG(target_bytes=20000)
+#    ....
+#    buffer = encoder.encode(frame)
+#    print(encoder.size, encoder.quality, encoder.encodes,
+#          encoder.latency_ms)
+
+##########################################################################
+
+import cv2
+import collections
+import concurrent.futures
+import os
+import numpy as np
+
+##########################################################################
+
+# JPEG encode the image at the given quality, decode it again, and return
+# (decoded image, compressed size in bytes, PSNR of decoded vs. original)
+# - as a worker task
+
+
+def jpeg_round_trip(img, quality):
+
+    ret, buffer = cv2.imencode(".jpg", img,
+                               [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+    if not (ret):
+        raise ValueError("jpeg_round_trip: cannot encode image")
+
+    decoded = cv2.imdecode(buffer, cv2.IMREAD_UNCHANGED)
+    return (decoded, buffer.size, cv2.PSNR(img, decoded))
+
+##########################################################################
+
+
+class JPEGCodec:
+    def __init__(self, workers=None):
+
+        # pool of worker threads
+
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+
+    def encode(self, img, quality=90):
+
+        # return the JPEG encoding of the image (as a buffer of bytes)
+
+        ret, buffer = cv2.imencode(
+            ".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+        return buffer if (ret) else None
+
+    def decode(self, buffer, flags=cv2.IMREAD_COLOR):
+        return cv2.imdecode(buffer, flags)
+
+    def submit(self, img, quality=90):
+
+        # start a round trip on the pool, returning its future - whose
+        # result is (decoded image, size, PSNR)
+
+        return self.pool.submit(jpeg_round_trip, img, quality)
+
+    def round_trip(self, img, quality=90):
+        return jpeg_round_trip(img, quality)
+
+    def quality_sweep(self, img, qualities=range(10, 101, 10)):
+
+        # evaluate the round trip of the image at each quality level in
+        # parallel, returning a list of (quality, size, PSNR)
+
+        jobs = [(quality, self.submit(img, quality)) for quality in qualities]
+        return [(quality,) + job.result()[1:] for (quality, job) in jobs]
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+    def __del__(self):
+        self.pool.shutdown(wait=False)
+
+##########################################################################
+
+# model of JPEG size (bytes) against quality for a scene, identified by its
+# signature (a small grey-scale thumbnail)
+
+
+class SceneModel:
+    def __init__(self, signature):
+        self.signature = signature
+        self.sizes = {}        # size by quality (most recent observation)
+        self.quality = None    # quality chosen for the last frame
+
+    def _curve(self):
+
+        # observations as arrays of quality and (monotonic) size
+
+        qualities = sorted(self.sizes)
+        sizes = np.maximum.accumulate(
+            np.array([self.sizes[q] for q in qualities], np.float64))
+        return (np.array(qualities, np.float64), sizes)
+
+    def size_at(self, quality):
+
+        # expected size at quality, interpolated from the observations (and
+        # outside of them, taken as proportional to quality from the
+        # nearest) - or None if there are none
+
+        if (len(self.sizes) == 0):
+            return None
+
+        qualities, sizes = self._curve()
+        if (quality < qualities[0]):
+            return sizes[0] * quality / qualities[0]
+        elif (quality > qualities[-1]):
+            return sizes[-1] * quality / qualities[-1]
+        return np.interp(quality, qualities, sizes)
+
+    def predict(self, target_bytes, low, high):
+
+        # predict the highest quality in [low, high] with size within the
+        # target, likewise - or None if there are no observations
+
+        if (len(self.sizes) == 0):
+            return None
+
+        qualities, sizes = self._curve()
+        if (target_bytes < sizes[0]):
+            quality = qualities[0] * target_bytes / max(1.0, sizes[0])
+        elif (target_bytes > sizes[-1]):
+            quality = qualities[-1] * target_bytes / max(1.0, sizes[-1])
+        else:
+            quality = np.interp(target_bytes, sizes, qualities)
+        return int(min(max(np.floor(quality), low), high))
+
+##########################################################################
+
+
+class RateControlledJPEG:
+    def __init__(self, target_bytes, tolerance=0.1, min_quality=5,
+                 max_quality=100, max_encodes=8, scene_threshold=12.0,
+                 scene_change=0.25, max_scenes=16):
+
+        # target size (bytes per frame), the fraction below the target that
+        # is accepted without further search, range of qualities and the
+        # maximum number of encodes per frame
+
+        self.target_bytes = target_bytes
+        self.tolerance = tolerance
+        self.min_quality = min_quality
+        self.max_quality = max_quality
+        self.max_encodes = max(1, max_encodes)
+
+        # cache of scene models (least recently used first), matched by the
+        # mean absolute difference between signatures and then confirmed by
+        # the size of the first encode, which must be within a fraction
+        # (scene_change) of that of the model at the same quality
+
+        self.scene_threshold = scene_threshold
+        self.scene_change = scene_change
+        self.max_scenes = max_scenes
+        self.scenes = collections.OrderedDict()
+        self.next_scene = 0
+        self.scene = None
+
+        # statistics for the last frame - size (bytes), quality, number of
+        # encodes and latency (ms.) - and totals over all frames
+
+        self.size = 0
+        self.quality = None
+        self.encodes = 0
+        self.latency_ms = 0
+        self.frames = 0
+        self.total_encodes = 0
+
+    def _signature(self, img):
+        signature = cv2.resize(img, (16, 9), interpolation=cv2.INTER_AREA)
+        if (len(signature.shape) == 3):
+            signature = cv2.cvtColor(signature, cv2.COLOR_BGR2GRAY)
+        return signature.astype(np.float32)
+
+    def _matches_size(self, model, quality, size):
+
+        # whether the size at quality is consistent with that expected by
+        # the model (or the model has no observations)
+
+        expected = model.size_at(quality)
+        return (expected is None) or (abs(size - expected)
+                                      <= (self.scene_change * expected))
+
+    def _scene(self, signature, quality=None, size=None):
+
+        # return the cached model of the scene of the image - the current
+        # scene if within threshold, otherwise the most similar within
+        # threshold (in either case, if given, consistent with the size at
+        # quality) or a new model
+
+        best, best_difference = None, self.scene_threshold
+        for scene_id, model in self.scenes.items():
+            difference = cv2.mean(cv2.absdiff(signature, model.signature))[0]
+            if ((difference < self.scene_threshold)
+                    and ((size is None)
+                         or self._matches_size(model, quality, size))):
+                if (scene_id == self.scene):
+                    best = scene_id
+                    break
+                if (difference < best_difference):
+                    best, best_difference = scene_id, difference
+
+        if best is None:
+            best = self.next_scene
+            self.next_scene += 1
+            self.scenes[best] = SceneModel(signature)
+            if (len(self.scenes) > self.max_scenes):
+                self.scenes.popitem(last=False)
+        else:
+            self.scenes.move_to_end(best)
+            self.scenes[best].signature = signature
+
+        self.scene = best
+        return self.scenes[best]
+
+    def encode(self, img):
+
+        # return the JPEG encoding of the image at the highest quality found
+        # with size within the target (or at the minimum quality if none)
+
+        start_t = cv2.getTickCount()
+        signature = self._signature(img)
+        model = self._scene(signature)
+
+        # first guess - as predicted by the scene model, or the quality of
+        # the previous frame (of any scene)
+
+        low, high = self.min_quality, self.max_quality
+        quality = model.predict(self.target_bytes, low, high)
+        if quality is None:
+            quality = self.quality or ((low + high) // 2)
+
+        best = None
+        tried = set()
+        encodes = slow = 0
+        while True:
+            ret, buffer = cv2.imencode(
+                ".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY), int(quality)])
+            encodes += 1
+            tried.add(quality)
+
+            if (encodes == 1):
+
+                # (a size inconsistent with the model on the first encode
+                # indicates a different scene of similar appearance)
+
+                if not (self._matches_size(model, quality, buffer.size)):
+                    model = self._scene(signature, quality, buffer.size)
+
+                # otherwise the model is scaled to the change in size since
+                # it was last observed (e.g. gradual change in content)
+
+                elif (len(model.sizes) > 0):
+                    scale = buffer.size / max(1.0, model.size_at(quality))
+                    for q in model.sizes:
+                        model.sizes[q] *= scale
+            model.sizes[quality] = buffer.size
+
+            width = high - low
+            if (buffer.size <= self.target_bytes):
+                if (best is None) or (quality > best[0]):
+                    best = (quality, buffer)
+                low = quality + 1
+                if (buffer.size >= ((1 - self.tolerance)
+                                    * self.target_bytes)):
+                    break
+            else:
+                high = quality - 1
+
+            if (low > high) or (encodes >= self.max_encodes):
+                break
+
+            # next guess - interpolated from the (updated) model within the
+            # bisection bounds, or their mid-point if already tried for this
+            # frame or if successive guesses have not halved the bounds
+
+            slow = (slow + 1) if ((high - low) > (width // 2)) else 0
+            quality = model.predict(self.target_bytes, low, high)
+            if (quality in tried) or (slow >= 2):
+                quality = (low + high) // 2
+                slow = 0
+
+        if best is None:
+            if (quality != self.min_quality):
+                ret, buffer = cv2.imencode(
+                    ".jpg", img, [int(cv2.IMWRITE_JPEG_QUALITY),
+                                  int(self.min_quality)])
+                encodes += 1
+                model.sizes[self.min_quality] = buffer.size
+            best = (self.min_quality, buffer)
+
+        # update statistics
+
+        self.quality, buffer = best
+        model.quality = self.quality
+        self.size = buffer.size
+        self.encodes = encodes
+        self.latency_ms = ((cv2.getTickCount() - start_t)
+                           / cv2.getTickFrequency()) * 1000
+        self.frames += 1
+        self.total_encodes += encodes
+
+        return buffer
+
+    def mean_encodes(self):
+
+        # mean number of encodes per frame over all frames
+
+        return self.total_encodes / max(1, self.frames)
+
+##########################################################################
@@ -4,6 +4,15 @@
 # specified on the command line (e.g. python FILE.py video_file) or from an
 # attached web camera
 
+# (optionally, via -s, with a sweep over JPEG quality levels performed in
+# parallel on each frame, plotted as a rate-distortion curve)
+
+# (optionally, via -b, with the JPEG quality of each frame chosen to meet a
+# target size in bytes per frame - e.g. for a bandwidth limited link)
+
+# (optionally, via -m, with the PSNR / SSIM / MS-SSIM of the JPEG compressed
+# version against the original)
+
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
 # Copyright (c) 2015 School of Engineering & Computing Science,
@@ -17,6 +26,9 @@ import cv2
 import argparse
 import sys
 import math
+import numpy as np
+import jpeg_codec
+import image_metrics
 
 #####################################################################
 
@@ -40,6 +52,30 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-s",
+    "--sweep",
+    action='store_true',
+    help="plot the size / PSNR over a sweep of JPEG quality levels")
+parser.add_argument(
+    "-b",
+    "--budget",
+    type=int,
+    help="target JPEG size in bytes per frame (quality set per frame)",
+    default=0)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="number of JPEG encode / decode threads (default: one per core)",
+    default=None)
+parser.add_argument(
+    "-m",
+    "--metrics",
+    type=float,
+    help="show PSNR / SSIM / MS-SSIM against the original, computed at this "
+    "scale (e.g. 0.5 for a fast estimate)",
+    default=0)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -59,42 +95,95 @@ def nothing(x):
     pass
 
 
+#####################################################################
+
+# draw the rate-distortion curve of a quality sweep - a list of (quality,
+# size, PSNR) - as PSNR against size (KB), marking the current quality
+
+
+def draw_rate_distortion(sweep, quality, width=480, height=320, border=40):
+
+    plot = np.zeros((height, width, 3), np.uint8)
+
+    sizes = np.array([size for (_, size, _) in sweep], np.float64) / 1000
+    psnrs = np.array([min(psnr, 99) for (_, _, psnr) in sweep], np.float64)
+    x = border + ((sizes - sizes.min()) * (width - (2 * border))
+                  / max(1e-6, np.ptp(sizes)))
+    y = (height - border) - ((psnrs - psnrs.min()) * (height - (2 * border))
+                             / max(1e-6, np.ptp(psnrs)))
+    points = np.column_stack((x, y)).astype(np.int32)
+
+    cv2.polylines(plot, [points], False, (255, 255, 255), 1, cv2.LINE_AA)
+    for (q, _, _), point in zip(sweep, points):
+        colour = (0, 0, 255) if (q == quality) else (0, 255, 0)
+        cv2.circle(plot, tuple(int(v) for v in point), 3, colour, -1)
+        cv2.putText(plot, str(q), (int(point[0]) + 4, int(point[1]) - 4),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.35, colour, 1)
+
+    cv2.putText(plot, "PSNR %.1f - %.1f dB" % (psnrs.min(), psnrs.max()),
+                (5, 15), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    cv2.putText(plot, "size %.1f - %.1f KB" % (sizes.min(), sizes.max()),
+                (5, height - 8), cv2.FONT_HERSHEY_SIMPLEX, 0.4,
+                (255, 255, 255), 1)
+    return plot
+
+
 #####################################################################
 
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
 window_name = "Live Camera Input"  # window name
 window_name2 = "JPEG compression noise"  # window name
 window_name_jpeg = "JPEG compressed version"  # window name
+window_name_rd = "Rate-Distortion"  # window name
+
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create window by name (note flags for resizable or not)
 
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
     cv2.namedWindow(window_name2, cv2.WINDOW_NORMAL)
     cv2.namedWindow(window_name_jpeg, cv2.WINDOW_NORMAL)
+    if (args.sweep):
+        cv2.namedWindow(window_name_rd, cv2.WINDOW_AUTOSIZE)
+
+    # JPEG encode / decode service (thread pool)
+
+    codec = jpeg_codec.JPEGCodec(workers=args.workers)
+
+    # rate controlled JPEG encoder (if a target size is specified)
+
+    if (args.budget > 0):
+        encoder = jpeg_codec.RateControlledJPEG(target_bytes=args.budget)
+
+    # image quality metrics (if specified)
+
+    if (args.metrics > 0):
+        metrics = image_metrics.ImageMetrics(scale=args.metrics, ms_ssim=True)
 
     jpeg_quality = 90
     cv2.createTrackbar("JPEG quality",
@@ -134,6 +223,15 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         # write/compress and then read back from as JPEG
 
         jpeg_quality = cv2.getTrackbarPos("JPEG quality", window_name2)
+
+        # or as chosen for this frame to meet the target size (shown on the
+        # trackbar)
+
+        if (args.budget > 0):
+            buffer = encoder.encode(frame)
+            jpeg_quality = encoder.quality
+            cv2.setTrackbarPos("JPEG quality", window_name2, jpeg_quality)
+
         encode_param = [int(cv2.IMWRITE_JPEG_QUALITY), jpeg_quality]
 
         # either via file output / input
@@ -143,8 +241,30 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
 
         # or via encoding / decoding in a memory buffer
 
-        retval, buffer = cv2.imencode(".JPG", frame, encode_param)
-        jpeg_img = cv2.imdecode(buffer, flags=cv2.IMREAD_COLOR)
+        # retval, buffer = cv2.imencode(".JPG", frame, encode_param)
+        # jpeg_img = cv2.imdecode(buffer, flags=cv2.IMREAD_COLOR)
+
+        # or (as here) via the JPEG encode / decode service - on its pool of
+        # threads concurrently with the quality sweep (if specified) - or
+        # decoding the rate controlled encoding
+
+        if (args.budget == 0):
+            job = codec.submit(frame, jpeg_quality)
+        if (args.sweep):
+            sweep = codec.quality_sweep(
+                frame, sorted(set(range(10, 101, 10)) | {jpeg_quality}))
+        if (args.budget > 0):
+            jpeg_img = codec.decode(buffer)
+        else:
+            jpeg_img = job.result()[0]
+
+        # compute the quality metrics of the compressed version against the
+        # original (shown in the title of its window)
+
+        if (args.metrics > 0):
+            metrics.measure(frame, jpeg_img)
+            cv2.setWindowTitle(window_name_jpeg,
+                               window_name_jpeg + " - " + metrics.label())
 
         # compute absolute difference between original and compressed version
 
@@ -163,7 +283,16 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
 
         cv2.imshow(window_name, frame)
         cv2.imshow(window_name2, amplified_diff_img)
+        if (args.budget > 0):
+            label = ("%d / %d bytes, quality %d, %d encode(s), %.1f ms"
+                     % (encoder.size, args.budget, encoder.quality,
+                        encoder.encodes, encoder.latency_ms))
+            cv2.putText(jpeg_img, label, (10, 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
         cv2.imshow(window_name_jpeg, jpeg_img)
+        if (args.sweep):
+            cv2.imshow(window_name_rd, draw_rate_distortion(sweep,
+                                                            jpeg_quality))
 
         # stop the timer and convert to ms. (to see how long processing and
         # display takes)
@@ -193,8 +322,9 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         if (key == ord('x')):
             keep_processing = False
 
-    # close all windows
+    # shut down the JPEG encode / decode service and close all windows
 
+    codec.close()
     cv2.destroyAllWindows()
 
 else:
@@ -1,6 +1,8 @@
 #####################################################################
 
 # Example : mean filter on an image from an attached web camera
+# (press "i" to toggle use of an integral image based mean filter)
+# (optionally, via -m, with quality metrics of the filtered image)
 
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
@@ -14,6 +16,8 @@
 import cv2
 import sys
 import argparse
+import integral_filter
+import image_metrics
 
 #####################################################################
 
@@ -37,6 +41,13 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-m",
+    "--metrics",
+    type=float,
+    help="show PSNR / SSIM / MS-SSIM against the input, computed at this "
+    "scale (e.g. 0.5 for a fast estimate)",
+    default=0)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -45,6 +56,8 @@ parser.add_argument(
     help='specify optional video file')
 args = parser.parse_args()
 
+use_integral_image = False  # toggle integral image based mean filtering
+
 
 #####################################################################
 
@@ -60,36 +73,44 @@ def nothing(x):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
 window_name = "Live Camera Input"  # window name
 window_name2 = "Mean Filtering"  # window name
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
+
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create window by name
 
     cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
     cv2.namedWindow(window_name2, cv2.WINDOW_AUTOSIZE)
 
+    # image quality metrics (if specified)
+
+    if (args.metrics > 0):
+        metrics = image_metrics.ImageMetrics(scale=args.metrics, ms_ssim=True)
+
     # add some track bar controllers for settings
 
     neighbourhood = 3
@@ -100,6 +121,11 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         25,
         nothing)
 
+    # set up an integral image (summed area table) based mean filter that
+    # can serve any neighbourhood size up to the trackbar maximum
+
+    integral_mean = integral_filter.IntegralImageFilter(max_neighbourhood=25)
+
     while (keep_processing):
 
         # if video file or camera successfully open then read frame from video
@@ -125,20 +151,39 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
 
         neighbourhood = max(3, neighbourhood)
 
-        # in opencv blur() performs filtering with a NxN kernel where each
-        # element has a weight of 1 / (N^2) - this is mean filtering
+        if (use_integral_image):
 
-        mean_img = cv2.blur(
-            frame,
-            (neighbourhood,
-             neighbourhood),
-            borderType=cv2.BORDER_DEFAULT)
+            # compute the integral image once for this frame, from which
+            # the mean of any NxN neighbourhood is then obtained via 4
+            # lookups per pixel (independent of N)
+
+            integral_mean.set_image(frame)
+            mean_img = integral_mean.mean(neighbourhood)
+
+        else:
+
+            # in opencv blur() performs filtering with a NxN kernel where each
+            # element has a weight of 1 / (N^2) - this is mean filtering
+
+            mean_img = cv2.blur(
+                frame,
+                (neighbourhood,
+                 neighbourhood),
+                borderType=cv2.BORDER_DEFAULT)
 
         # display image
 
         cv2.imshow(window_name, frame)
         cv2.imshow(window_name2, mean_img)
 
+        # show the quality metrics of the filtered image against the input
+        # (i.e. the extent of the change made by the filter) in the title
+
+        if (args.metrics > 0):
+            metrics.measure(frame, mean_img)
+            cv2.setWindowTitle(window_name2,
+                               window_name2 + " - " + metrics.label())
+
         # start the event loop - essential
 
         # cv2.waitKey() is a keyboard binding function (argument is the time in
@@ -159,6 +204,14 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         if (key == ord('x')):
             keep_processing = False
 
+        elif (key == ord('i')):
+
+            # toggle integral image based mean filtering (when they press 'i')
+
+            use_integral_image = not (use_integral_image)
+            print("INFO: integral image mean filtering - "
+                  + str(use_integral_image))
+
     # close all windows
 
     cv2.destroyAllWindows()
@@ -0,0 +1,433 @@
+##########################################################################
+
+# motion detection via background subtraction - running average, median of
+# the last K frames (ring buffer), MOG2 or KNN background models behind a
+# single interface, computed on a down-scaled frame with the resulting
+# foreground (motion) mask upsampled to the original frame size
+
+# + a motion gate - a cheap down-sampled difference score used to skip
+# expensive processing of static frames (re-using the previous output) or
+# to process only the image tiles that have changed (dirty rectangles)
+
+# + motion events - connected components (blobs) of the motion mask, filtered
+# by area, written as JSON-lines event records by a background thread
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as per example in abs_difference.py:
+
+#    import motion_detection
+#    detector = motion_detection.MotionDetector(method="average", scale=0.5)
+#    ....
+#    mask = detector.apply(frame)        # 255 = motion, 0 = background
+
+# available methods: "average" (running average via cv2.accumulateWeighted),
+# "median" (median of the last K frames), "mog2" and "knn" (as per OpenCV
+# cv2.createBackgroundSubtractorMOG2() / cv2.createBackgroundSubtractorKNN())
+
+# motion gate usage - wrapping any expensive per-frame processing function
+# (that returns an image of the same size as its input), as per example in
+# nlm_filter.py:
+
+#    gate = motion_detection.MotionGate(threshold=2.0, tile_size=64)
+#    ....
+#    output = gate.process(frame, lambda img: cv2.bilateralFilter(...))
+
+# motion event usage - as per example in abs_difference.py:
+
+#    events = motion_detection.MotionEventWriter("events.jsonl")
+#    ....
+#    blobs = motion_detection.motion_blobs(mask, min_area=100)
+#    events.emit(frame_number, cap.get(cv2.CAP_PROP_POS_MSEC), blobs)
+#    ....
+#    events.close()
+
+# each event is written as one line of the form:
+# {"frame": 42, "timestamp": 1680.0, "bbox": [x, y, w, h], "area": 512}
+
+##########################################################################
+
+import cv2
+import json
+import queue
+import threading
+import numpy as np
+
+##########################################################################
+
+methods = ("average", "median", "mog2", "knn")
+
+##########################################################################
+
+
+class MotionDetector:
+    def __init__(self, method="average", scale=0.5, threshold=25,
+                 alpha=0.05, history=None):
+
+        if method not in methods:
+            raise ValueError('MotionDetector: unknown method ' + str(method)
+                             + ' (not one of ' + str(methods) + ')')
+
+        # method, scale at which the frame is processed, threshold on the
+        # absolute difference from the background (average / median), rate
+        # of running average update (average) and number of frames in the
+        # background model history (median / mog2 / knn - by default 9 and
+        # 500 frames respectively)
+
+        self.method = method
+        self.scale = scale
+        self.threshold = threshold
+        self.alpha = alpha
+        if history is None:
+            history = 9 if (method == "median") else 500
+        self.history = max(1, history)
+
+        # background model state (set up on the first frame)
+
+        self.background = None
+        self.frames = None
+        self.frame_index = 0
+        self.subtractor = None
+
+        if (method == "mog2"):
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(
+                history=self.history, detectShadows=True)
+        elif (method == "knn"):
+            self.subtractor = cv2.createBackgroundSubtractorKNN(
+                history=self.history, detectShadows=True)
+
+        # buffers re-used between frames
+
+        self.small = None
+        self.grey = None
+        self.difference = None
+        self.mask = None
+
+    def _downscale(self, frame):
+
+        # resize the frame to the processing scale (into a re-used buffer)
+
+        if (self.scale == 1.0):
+            return frame
+
+        height, width = frame.shape[:2]
+        size = (max(1, int(width * self.scale)),
+                max(1, int(height * self.scale)))
+        self.small = cv2.resize(frame, size, dst=self.small,
+                                interpolation=cv2.INTER_AREA)
+        return self.small
+
+    def _greyscale(self, small):
+        if (len(small.shape) == 3):
+            self.grey = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY,
+                                     dst=self.grey)
+            return self.grey
+        return small
+
+    def apply(self, frame):
+
+        # update the background model with the frame and return its
+        # foreground (motion) mask at the frame size
+
+        small = self._downscale(frame)
+
+        if self.subtractor is not None:
+
+            # MOG2 / KNN - foreground is 255, detected shadows 127 (which are
+            # not considered as motion here)
+
+            foreground = self.subtractor.apply(small)
+            cv2.threshold(foreground, 127, 255, cv2.THRESH_BINARY,
+                          dst=foreground)
+
+        else:
+            grey = self._greyscale(small)
+
+            if (self.method == "average"):
+
+                # running average background (in floating point)
+
+                if self.background is None:
+                    self.background = grey.astype(np.float32)
+                background = cv2.convertScaleAbs(self.background)
+                cv2.accumulateWeighted(grey, self.background, self.alpha)
+
+            else:
+
+                # median of the last K frames (held in a ring buffer)
+
+                if self.frames is None:
+                    self.frames = np.repeat(grey[np.newaxis], self.history,
+                                            axis=0)
+                background = np.median(self.frames, axis=0).astype(np.uint8)
+                self.frames[self.frame_index % self.history] = grey
+                self.frame_index += 1
+
+            # threshold the absolute difference from the background (both
+            # saturating and in place on re-used buffers)
+
+            self.difference = cv2.absdiff(grey, background,
+                                          dst=self.difference)
+            cv2.threshold(self.difference, self.threshold, 255,
+                          cv2.THRESH_BINARY, dst=self.difference)
+            foreground = self.difference
+
+        # upsample the mask to the original frame size
+
+        if (self.scale == 1.0):
+            return foreground
+
+        height, width = frame.shape[:2]
+        self.mask = cv2.resize(foreground, (width, height), dst=self.mask,
+                               interpolation=cv2.INTER_NEAREST)
+        return self.mask
+
+##########################################################################
+
+# motion gate - compares a small grey-scale version of each frame to that of
+# the last frame processed (the reference), such that if the mean absolute
+# difference stays below threshold the previous output is re-used, and if
+# only some tiles of the frame have changed (maximum difference above
+# tile_threshold) only those are re-processed
+
+
+class MotionGate:
+    def __init__(self, scale=0.125, threshold=2.0, tile_size=64,
+                 tile_threshold=8.0, max_dirty=0.5, border=16):
+
+        # scale of the difference image, thresholds on its mean (whole
+        # frame) and maximum (per tile), tile size (in frame pixels), the
+        # largest fraction of dirty tiles for which tiles are processed
+        # separately and the border (in frame pixels) around each tile
+        # processed to support the neighbourhood of the processing function
+        # (which must be at least the radius of that neighbourhood, so set
+        # from the parameters of the function, else tiles show seams)
+
+        self.scale = scale
+        self.threshold = threshold
+        self.tile_size = tile_size
+        self.tile_threshold = tile_threshold
+        self.max_dirty = max_dirty
+        self.border = border
+
+        # reference (small, grey-scale) frame and its output
+
+        self.reference = None
+        self.output = None
+
+        # counts of frames skipped, processed by tile and processed in full
+
+        self.skipped = 0
+        self.tiled = 0
+        self.processed = 0
+
+    def reset(self):
+
+        # discard the reference and its output (e.g. when the parameters of
+        # the processing function change) such that the next frame is
+        # processed in full
+
+        self.reference = None
+        self.output = None
+
+    def _grid(self, frame):
+
+        # number of tile rows and columns covering the frame, and the size of
+        # each tile within the (small) difference image
+
+        height, width = frame.shape[:2]
+        rows = int(np.ceil(height / self.tile_size))
+        cols = int(np.ceil(width / self.tile_size))
+        tile = max(1, int(round(self.tile_size * self.scale)))
+        return (rows, cols, tile)
+
+    def _small(self, frame):
+
+        # grey-scale frame resized such that each tile maps to a (tile x
+        # tile) block of pixels, padded to a whole number of tiles
+
+        height, width = frame.shape[:2]
+        rows, cols, tile = self._grid(frame)
+        small_width = min(cols * tile, int(np.ceil(width * tile
+                                                   / self.tile_size)))
+        small_height = min(rows * tile, int(np.ceil(height * tile
+                                                    / self.tile_size)))
+        small = cv2.resize(frame, (small_width, small_height),
+                           interpolation=cv2.INTER_AREA)
+        if (len(small.shape) == 3):
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.copyMakeBorder(small, 0, (rows * tile) - small_height, 0,
+                                  (cols * tile) - small_width,
+                                  cv2.BORDER_REPLICATE)
+
+    def check(self, frame):
+
+        # return the mean difference score of the frame from the reference,
+        # the (row, col) indices of the dirty tiles (or None if there is no
+        # reference yet) and the small grey-scale frame
+
+        small = self._small(frame)
+        if (self.reference is None) or (small.shape != self.reference.shape):
+            return (float("inf"), None, small)
+
+        difference = cv2.absdiff(small, self.reference)
+        score = cv2.mean(difference)[0]
+
+        # maximum difference per tile (over each block of the difference
+        # image, itself an average over blocks of the frame by the resize)
+
+        rows, cols, tile = self._grid(frame)
+        tile_max = difference.reshape(rows, tile, cols, tile).max(axis=(1, 3))
+        dirty = np.nonzero(tile_max > self.tile_threshold)
+
+        return (score, list(zip(*dirty)), small)
+
+    def process(self, frame, function):
+
+        # return function(frame) - re-using the previous output if the frame
+        # is static or only re-processing its dirty tiles where possible
+
+        score, tiles, small = self.check(frame)
+
+        # static - below threshold overall and with no dirty tiles
+
+        if ((tiles is not None) and (score < self.threshold)
+                and (len(tiles) == 0)):
+            self.skipped += 1
+            return self.output
+
+        rows, cols, tile = self._grid(frame)
+
+        # (a score above threshold with no dirty tiles, e.g. a small global
+        # change in brightness, requires the whole frame to be processed)
+
+        if ((tiles is not None) and (0 < len(tiles) <= (self.max_dirty
+                                                        * rows * cols))):
+
+            # process each dirty tile (plus border) pasting the result into
+            # a copy of the previous output - updating only those tiles of
+            # the reference, such that slow changes elsewhere accumulate
+            # until they exceed the threshold
+
+            height, width = frame.shape[:2]
+            output = self.output.copy()
+            for row, col in tiles:
+                x, y = col * self.tile_size, row * self.tile_size
+                w = min(self.tile_size, width - x)
+                h = min(self.tile_size, height - y)
+                x0, y0 = max(0, x - self.border), max(0, y - self.border)
+                x1 = min(width, x + w + self.border)
+                y1 = min(height, y + h + self.border)
+                result = function(frame[y0:y1, x0:x1])
+                output[y:y + h, x:x + w] = result[y - y0:y - y0 + h,
+                                                  x - x0:x - x0 + w]
+
+                sy, sx = row * tile, col * tile
+                self.reference[sy:sy + tile, sx:sx + tile] = \
+                    small[sy:sy + tile, sx:sx + tile]
+            self.tiled += 1
+
+        else:
+            output = function(frame)
+            self.reference = small
+            self.processed += 1
+
+        self.output = output
+        return output
+
+##########################################################################
+
+# return the connected components (blobs) of the (binary) motion mask with
+# an area (in pixels) of at least min_area (and at most max_area, if set)
+# as a list of (x, y, w, h, area)
+
+
+def motion_blobs(mask, min_area=100, max_area=None, connectivity=8):
+
+    _, _, stats, _ = cv2.connectedComponentsWithStats(
+        mask, connectivity=connectivity)
+
+    # (label 0 is the background)
+
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = areas >= min_area
+    if max_area is not None:
+        keep &= areas <= max_area
+
+    return [tuple(int(v) for v in blob)
+            for blob in stats[1:][keep][:, :cv2.CC_STAT_AREA + 1]]
+
+##########################################################################
+
+# writes motion events as JSON-lines records to a file (path or open file
+# object) via a background thread, such that the processing loop is never
+# blocked on output - events are dropped (and counted) if the queue of
+# events awaiting writing is full
+
+
+class MotionEventWriter:
+    def __init__(self, output, max_queue=1024):
+
+        # output file (opened here if given as a path) and queue of events
+        # awaiting writing
+
+        if isinstance(output, str):
+            self.file = open(output, "a")
+            self.close_file = True
+        else:
+            self.file = output
+            self.close_file = False
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0
+        self.written = 0
+
+        self.thread = threading.Thread(target=self._write, daemon=True,
+                                       name="MotionEventWriter")
+        self.thread.start()
+
+    def _write(self):
+
+        # write each record as it arrives (flushing whenever the queue is
+        # empty) until the end sentinel (None) is received
+
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            self.file.write(json.dumps(record, separators=(",", ":")) + "\n")
+            self.written += 1
+            if self.queue.empty():
+                self.file.flush()
+        self.file.flush()
+
+    def emit(self, frame_number, timestamp, blobs):
+
+        # queue an event for each blob (x, y, w, h, area) of the frame
+
+        for x, y, w, h, area in blobs:
+            try:
+                self.queue.put_nowait({"frame": int(frame_number),
+                                       "timestamp": float(timestamp),
+                                       "bbox": [x, y, w, h],
+                                       "area": area})
+            except queue.Full:
+                self.dropped += 1
+
+    def close(self):
+
+        # write any outstanding events and stop the writer thread
+
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.close_file:
+            self.file.close()
+
+##########################################################################
@@ -1,7 +1,11 @@
 #####################################################################
 
 # Example : mean and non-local means filter on an image from an attached
-# web camera
+# web camera (optionally using temporal multi-frame non-local means over a
+# sliding window of frames, denoised concurrently by a pool of workers, or
+# at reduced resolution whenever a per-frame time budget is exceeded - and
+# optionally gated by motion, such that static frames (or tiles) are not
+# re-filtered - and with quality metrics of the filtered images, via -m)
 
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
@@ -15,6 +19,10 @@
 import cv2
 import sys
 import argparse
+import math
+import motion_detection
+import nlm_video
+import image_metrics
 
 #####################################################################
 
@@ -38,6 +46,36 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-t",
+    "--temporal_window",
+    type=int,
+    help="use temporal NLM over a window of this many (odd) frames",
+    default=0)
+parser.add_argument(
+    "-w",
+    "--workers",
+    type=int,
+    help="number of temporal NLM workers (default: one per CPU core)",
+    default=None)
+parser.add_argument(
+    "-b",
+    "--budget",
+    type=int,
+    help="adapt NLM resolution to this per-frame time budget in ms.",
+    default=0)
+parser.add_argument(
+    "-g",
+    "--gate",
+    action='store_true',
+    help="only re-filter frames (or tiles) that have changed via motion gate")
+parser.add_argument(
+    "-m",
+    "--metrics",
+    type=float,
+    help="show PSNR / SSIM / MS-SSIM against the input, computed at this "
+    "scale (e.g. 0.5 for a fast estimate)",
+    default=0)
 parser.add_argument(
     'video_file',
     metavar='video_file',
@@ -61,19 +99,19 @@ def nothing(x):
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) or, for
+    # video files, to decode frames ahead of processing (likewise)
 
-    if not (args.video_file):
-        import camera_stream
-        cap = camera_stream.CameraVideoStream(use_tapi=False)
-    else:
-        cap = cv2.VideoCapture()  # not needed for video files
+    import camera_stream
+    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    file_cap = camera_stream.VideoFileStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
 
     print("INFO: camera_stream class not found - camera input may be buffered")
     cap = cv2.VideoCapture()
+    file_cap = cv2.VideoCapture()
 
 # define display window name
 
@@ -81,11 +119,14 @@ window_name = "Live Camera Input"  # window name
 window_name2 = "Mean Filtering"  # window name
 window_name3 = "Non-Local Means Filtering"  # window name
 
-# if command line arguments are provided try to read video_file
-# otherwise default to capture from attached H/W camera
+# if command line arguments are provided try to read video_file (decoding
+# frames ahead) otherwise default to capture from attached H/W camera (as a
+# non-buffered camera stream, as decoding ahead would only add latency)
 
-if (((args.video_file) and (cap.open(str(args.video_file))))
-        or (cap.open(args.camera_to_use))):
+if ((args.video_file) and (file_cap.open(str(args.video_file)))):
+    cap = file_cap
+
+if ((cap is file_cap) or (cap.open(args.camera_to_use))):
 
     # create window by name
 
@@ -93,6 +134,11 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
     cv2.namedWindow(window_name2, cv2.WINDOW_AUTOSIZE)
     cv2.namedWindow(window_name3, cv2.WINDOW_AUTOSIZE)
 
+    # image quality metrics (if specified)
+
+    if (args.metrics > 0):
+        metrics = image_metrics.ImageMetrics(scale=args.metrics, ms_ssim=True)
+
     # add some track bar controllers for settings
 
     neighbourhood = 7
@@ -113,6 +159,26 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         25,
         nothing)
 
+    # set up temporal NLM denoising if specified (via a pool of workers)
+
+    if (args.temporal_window > 0):
+        temporal_nlm = nlm_video.TemporalNLMDenoiser(
+            temporal_window=args.temporal_window, workers=args.workers)
+        nlm_img = None
+
+    # set up adaptive resolution NLM if a per-frame time budget is specified
+
+    elif (args.budget > 0):
+        adaptive_nlm = nlm_video.AdaptiveResolutionNLM(budget_ms=args.budget)
+
+    # set up the motion gate if specified (for single frame NLM) and the
+    # filter parameters its previous output was computed with
+
+    if (args.gate):
+        gate = motion_detection.MotionGate()
+        gate_params = None
+
+    end_of_video = False
     while (keep_processing):
 
         # if video file or camera successfully open then read frame from video
@@ -124,6 +190,7 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
 
             if (ret == 0):
                 keep_processing = False
+                end_of_video = True
                 continue
 
             # rescale if specified
@@ -132,6 +199,10 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
                 frame = cv2.resize(
                     frame, (0, 0), fx=args.rescale, fy=args.rescale)
 
+        # start a timer (to see how long processing and display takes)
+
+        start_t = cv2.getTickCount()
+
         # get parameters from track bars
 
         neighbourhood = cv2.getTrackbarPos("neighbourhood, N", window_name2)
@@ -153,20 +224,105 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
              neighbourhood),
             borderType=cv2.BORDER_DEFAULT)
 
-        # perform NLM filtering on the same image
+        if (args.temporal_window > 0):
 
-        nlm_img = cv2.fastNlMeansDenoisingColored(
-            frame,
-            h=filter_strength,
-            hColor=10,
-            templateWindowSize=neighbourhood,
-            searchWindowSize=search_window)
+            # pass the frame to the temporal NLM workers and display the next
+            # denoised frame (in order) whenever one is ready - this lags the
+            # input by at least half the temporal window
+
+            temporal_nlm.submit(
+                frame,
+                h=filter_strength,
+                h_colour=10,
+                template_window=neighbourhood,
+                search_window=search_window)
+
+            result = temporal_nlm.get()
+            if result is not None:
+                _, nlm_img = result
+
+        else:
+
+            if (args.budget > 0):
+
+                # perform NLM filtering at the resolution (image pyramid
+                # level) the controller has selected to fit within the time
+                # budget
+
+                def nlm(img):
+                    return adaptive_nlm.filter(
+                        img,
+                        h=filter_strength,
+                        h_colour=10,
+                        template_window=neighbourhood,
+                        search_window=search_window)
+
+            else:
+
+                # perform NLM filtering on the same image
+
+                def nlm(img):
+                    return cv2.fastNlMeansDenoisingColored(
+                        img,
+                        h=filter_strength,
+                        hColor=10,
+                        templateWindowSize=neighbourhood,
+                        searchWindowSize=search_window)
+
+            if (args.gate):
+
+                # re-use the previous output for a static frame, or filter
+                # only the changed tiles (re-filtering all of the frame if
+                # the parameters have changed)
+
+                params = (filter_strength, neighbourhood, search_window)
+                if (params != gate_params):
+                    gate.reset()
+                    gate_params = params
+
+                # (with a border around each tile of the NLM search and
+                # template radius, in full resolution pixels)
+
+                gate.border = (search_window // 2) + (neighbourhood // 2)
+                if (args.budget > 0):
+                    gate.border *= 2 ** adaptive_nlm.level
+                nlm_img = gate.process(frame, nlm)
+            else:
+                nlm_img = nlm(frame)
 
         # display image
 
         cv2.imshow(window_name, frame)
         cv2.imshow(window_name2, mean_img)
-        cv2.imshow(window_name3, nlm_img)
+        if nlm_img is not None:
+            cv2.imshow(window_name3, nlm_img)
+
+        # show the quality metrics of the filtered images against the input
+        # (i.e. the extent of the change made by the filter) in the title -
+        # except for temporal NLM, where the output lags the input
+
+        if (args.metrics > 0):
+            metrics.measure(frame, mean_img)
+            cv2.setWindowTitle(window_name2,
+                               window_name2 + " - " + metrics.label())
+            if (nlm_img is not None) and (args.temporal_window == 0):
+                metrics.measure(frame, nlm_img)
+                cv2.setWindowTitle(window_name3,
+                                   window_name3 + " - " + metrics.label())
+
+        # stop the timer and convert to ms. (to see how long processing and
+        # display takes)
+
+        stop_t = ((cv2.getTickCount() - start_t) /
+                  cv2.getTickFrequency()) * 1000
+
+        # adapt the NLM resolution to the time taken (if in use)
+
+        if (args.temporal_window <= 0) and (args.budget > 0):
+            level = adaptive_nlm.level
+            if (adaptive_nlm.update(stop_t) != level):
+                print("INFO: NLM image pyramid level - "
+                      + str(adaptive_nlm.level))
 
         # start the event loop - essential
 
@@ -177,8 +333,10 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         # (bitwise and with 0xFF to extract least significant byte of
         # multi-byte response)
 
-        # wait 40ms (i.e. 1000ms / 25 fps = 40 ms)
-        key = cv2.waitKey(40) & 0xFF
+        # wait 40ms or less depending on processing time taken (i.e. 1000ms /
+        # 25 fps = 40 ms)
+
+        key = cv2.waitKey(max(2, 40 - int(math.ceil(stop_t)))) & 0xFF
 
         # It can also be set to detect specific key strokes by recording which
         # key is pressed
@@ -188,6 +346,20 @@ if (((args.video_file) and (cap.open(str(args.video_file))))
         if (key == ord('x')):
             keep_processing = False
 
+    # at the end of a video, display the last frames (those that were still
+    # awaiting later frames within the temporal window) as they are
+    # denoised, then shut down any temporal NLM workers
+
+    if (args.temporal_window > 0):
+        if (end_of_video):
+            temporal_nlm.flush()
+            while (temporal_nlm.pending() > 0):
+                _, nlm_img = temporal_nlm.get(block=True)
+                cv2.imshow(window_name3, nlm_img)
+                if (cv2.waitKey(40) & 0xFF) == ord('x'):
+                    break
+        temporal_nlm.close()
+
     # close all windows
 
     cv2.destroyAllWindows()
@@ -0,0 +1,287 @@
+##########################################################################
+
+# temporal (multi-frame) non-local means video denoising - frames are held
+# in a ring buffer forming a sliding temporal window around each frame and
+# denoised concurrently via a pool of workers, with the resulting frames
+# returned in their original order
+
+# + adaptive resolution non-local means - denoising is performed on a
+# down-sampled (image pyramid) level of the frame whenever the per-frame
+# time budget is exceeded, with the result upsampled via a guided filter
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as per example in nlm_filter.py:
+
+#    import nlm_video
+#    denoiser = nlm_video.TemporalNLMDenoiser(temporal_window=5, workers=4)
+#    ....
+#    while (keep_processing):
+#        ret, frame = cap.read()
+#        denoiser.submit(frame, h=10, search_window=21)
+#        result = denoiser.get()         # non-blocking
+#        if result is not None:
+#            (frame_index, denoised) = result
+#    ....
+#    denoiser.flush()                    # end of stream - denoise the rest
+#    while (denoiser.pending() > 0):
+#        (frame_index, denoised) = denoiser.get(block=True)
+#    denoiser.close()
+
+# adaptive resolution usage (frame_time_ms as measured via the usual
+# cv2.getTickCount() timing of the processing loop):
+
+#    adaptive = nlm_video.AdaptiveResolutionNLM(budget_ms=40)
+#    ....
+#    while (keep_processing):
+#        ....
+#        denoised = adaptive.filter(frame, h=10, search_window=21)
+#        ....
+#        adaptive.update(frame_time_ms)
+
+# output lags input by (at least) temporal_window // 2 frames, as each frame
+# is only denoised once the frames that follow it have arrived
+
+# N.B. workers are threads by default - OpenCV releases the Python GIL
+# whilst denoising, so they run concurrently, and (unlike processes) are
+# safe to start alongside a running capture thread and from scripts
+# without a __main__ guard
+
+##########################################################################
+
+import cv2
+import collections
+import concurrent.futures
+import os
+import numpy as np
+
+##########################################################################
+
+# denoise the frame at position index in the list frames (as a worker task)
+
+
+def denoise_frames(frames, index, temporal_window, h, h_colour,
+                   template_window, search_window):
+
+    if (len(frames[index].shape) == 3):
+        return cv2.fastNlMeansDenoisingColoredMulti(
+            frames, index, temporal_window, h=h, hColor=h_colour,
+            templateWindowSize=template_window,
+            searchWindowSize=search_window)
+
+    return cv2.fastNlMeansDenoisingMulti(
+        frames, index, temporal_window, h=h,
+        templateWindowSize=template_window, searchWindowSize=search_window)
+
+##########################################################################
+
+
+class TemporalNLMDenoiser:
+    def __init__(self, temporal_window=5, workers=None, use_processes=False):
+
+        # temporal window size (must be odd) and its half width
+
+        self.temporal_window = max(1, temporal_window | 1)
+        self.half_window = self.temporal_window // 2
+
+        # ring buffer of the most recent (frame_index, frame) pairs
+
+        self.frames = collections.deque(maxlen=self.temporal_window)
+
+        # pool of workers and the jobs dispatched to it (by frame index)
+        # limited to a few per worker such that the input cannot run away
+        # from the output
+
+        self.workers = workers or os.cpu_count() or 1
+        if (use_processes):
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.workers)
+        else:
+            self.pool = concurrent.futures.ThreadPoolExecutor(self.workers)
+        self.jobs = {}
+        self.max_jobs = 2 * self.workers
+
+        # next frame index to be received and to be returned
+
+        self.next_input = 0
+        self.next_output = 0
+
+        # filter parameters of the most recent submission
+
+        self.params = (10, 10, 7, 21)
+
+    def _dispatch(self, index):
+
+        # denoise frame index using the largest temporal window (up to the
+        # specified size) that is centred on it and available in the buffer
+
+        first = self.frames[0][0]
+        last = self.frames[-1][0]
+        half = min(self.half_window, index - first, last - index)
+        frames = [f for (i, f) in self.frames
+                  if (index - half) <= i <= (index + half)]
+
+        self.jobs[index] = self.pool.submit(
+            denoise_frames, frames, half, (2 * half) + 1, *self.params)
+
+    def submit(self, frame, h=10, h_colour=10, template_window=7,
+               search_window=21):
+
+        # if too many jobs are outstanding, wait for the oldest to finish
+
+        if (len(self.jobs) >= self.max_jobs):
+            self.jobs[min(self.jobs)].result()
+
+        # add a copy of the frame to the buffer (as camera frames may
+        # otherwise reside in the same portion of allocated memory)
+
+        self.params = (h, h_colour, template_window, search_window)
+        self.frames.append((self.next_input, frame.copy()))
+
+        # the frame half a window behind now has a full temporal window
+
+        if (self.next_input >= self.half_window):
+            self._dispatch(self.next_input - self.half_window)
+        self.next_input += 1
+
+    def flush(self):
+
+        # end of stream - dispatch the frames still awaiting later frames
+
+        for index in range(max(0, self.next_input - self.half_window),
+                           self.next_input):
+            self._dispatch(index)
+
+    def get(self, block=False):
+
+        # return the next (frame_index, denoised_frame) in frame order if
+        # available (waiting for it if block is True) otherwise None
+
+        job = self.jobs.get(self.next_output)
+        if (job is None) or not (block or job.done()):
+            return None
+
+        del self.jobs[self.next_output]
+        self.next_output += 1
+        return (self.next_output - 1, job.result())
+
+    def pending(self):
+
+        # number of frames dispatched but not yet returned via get()
+
+        return len(self.jobs)
+
+    def close(self):
+
+        # cancel any outstanding jobs and shut down the workers
+
+        for job in self.jobs.values():
+            job.cancel()
+        self.jobs.clear()
+        self.pool.shutdown(wait=True)
+
+    def __del__(self):
+        self.pool.shutdown(wait=False)
+
+##########################################################################
+
+# upsample the result of a filter computed at low resolution (low_output
+# from input low_guide) to the resolution of full_guide, via the fast
+# guided filter - the local linear model (a, b) relating the low resolution
+# input and output is computed over a (2 * radius + 1)^2 neighbourhood with
+# regularisation eps, upsampled, and applied to the full resolution input
+
+# Ref: He and Sun, "Fast Guided Filter", arXiv:1505.00996, 2015.
+
+
+def guided_upsample(low_guide, low_output, full_guide, radius=2, eps=100.0):
+
+    size = (2 * radius + 1, 2 * radius + 1)
+    guide = low_guide.astype(np.float32)
+    output = low_output.astype(np.float32)
+
+    mean_guide = cv2.boxFilter(guide, -1, size)
+    mean_output = cv2.boxFilter(output, -1, size)
+    covariance = cv2.boxFilter(guide * output, -1, size) - (
+        mean_guide * mean_output)
+    variance = cv2.boxFilter(guide * guide, -1, size) - (
+        mean_guide * mean_guide)
+
+    a = covariance / (variance + eps)
+    b = mean_output - (a * mean_guide)
+
+    height, width = full_guide.shape[:2]
+    a = cv2.resize(cv2.boxFilter(a, -1, size), (width, height),
+                   interpolation=cv2.INTER_LINEAR)
+    b = cv2.resize(cv2.boxFilter(b, -1, size), (width, height),
+                   interpolation=cv2.INTER_LINEAR)
+
+    upsampled = (a * full_guide.astype(np.float32)) + b
+    return np.clip(upsampled, 0, 255).astype(full_guide.dtype)
+
+##########################################################################
+
+
+class AdaptiveResolutionNLM:
+    def __init__(self, budget_ms=40, max_level=3, hysteresis=0.8):
+
+        # per-frame time budget (ms.), the coarsest image pyramid level that
+        # may be used and the fraction of the budget a finer level must be
+        # predicted to fit within before switching back to it
+
+        self.budget_ms = budget_ms
+        self.max_level = max_level
+        self.hysteresis = hysteresis
+
+        # current pyramid level (0 = full resolution) and time taken (ms.)
+        # for the most recent frame at that level
+
+        self.level = 0
+        self.frame_time_ms = 0
+
+    def filter(self, frame, h=10, h_colour=10, template_window=7,
+               search_window=21):
+
+        # denoise the frame at the current pyramid level
+
+        if (self.level == 0):
+            return denoise_frames([frame], 0, 1, h, h_colour,
+                                  template_window, search_window)
+
+        low = frame
+        for _ in range(self.level):
+            low = cv2.pyrDown(low)
+
+        # the noise is also attenuated by the down-sampling, so reduce the
+        # filter strength accordingly (by the same factor, 1/2 per level)
+
+        scale = 0.5 ** self.level
+        low_denoised = denoise_frames(
+            [low], 0, 1, max(1, h * scale), max(1, h_colour * scale),
+            template_window, search_window)
+
+        return guided_upsample(low, low_denoised, frame)
+
+    def update(self, frame_time_ms):
+
+        # adjust the pyramid level from the measured per-frame time - each
+        # level halves the image dimensions, giving (roughly) 4x fewer
+        # pixels to denoise
+
+        self.frame_time_ms = frame_time_ms
+
+        if (frame_time_ms > self.budget_ms) and (self.level < self.max_level):
+            self.level += 1
+        elif ((self.level > 0)
+                and ((4 * frame_time_ms)
+                     < (self.hysteresis * self.budget_ms))):
+            self.level -= 1
+
+        return self.level
+
+##########################################################################
@@ -4,6 +4,16 @@
 # specified as video.avi or from an
 # attached web camera and saving to a video file
 
+# (optionally, via -a, resizing and encoding frames on a separate thread
+# such that encoder delays do not hold up capture)
+
+# (optionally, via -s / -sb, rolling to a new file by duration / size and,
+# via -m, only recording clips when motion is detected - each starting with
+# a pre-roll of the preceding frames - key 't' also triggers a clip)
+
+# (optionally, via -pt, where frames are not modified, recording the
+# compressed stream of the source directly without decoding / re-encoding)
+
 # Author : Toby Breckon, toby.breckon@durham.ac.uk
 
 # Copyright (c) 2015 School of Engineering & Computing Science,
@@ -16,6 +26,8 @@
 import cv2
 import argparse
 import sys
+import motion_detection
+import video_writer
 
 #####################################################################
 
@@ -39,8 +51,56 @@ parser.add_argument(
     type=float,
     help="rescale image by this factor",
     default=1.0)
+parser.add_argument(
+    "-a",
+    "--asynchronous",
+    action='store_true',
+    help="resize and encode frames on a separate (writer) thread")
+parser.add_argument(
+    "-q",
+    "--queue",
+    type=int,
+    help="maximum number of frames queued for asynchronous writing",
+    default=64)
+parser.add_argument(
+    "-s",
+    "--segment",
+    type=float,
+    help="roll to a new output file after this many seconds of video",
+    default=0)
+parser.add_argument(
+    "-sb",
+    "--segment_mb",
+    type=float,
+    help="roll to a new output file after this many MB of output",
+    default=0)
+parser.add_argument(
+    "-m",
+    "--motion",
+    action='store_true',
+    help="only record clips (to clip_NNNN.avi) when motion is detected")
+parser.add_argument(
+    "-p",
+    "--pre_roll",
+    type=float,
+    help="seconds of video recorded before (and after) motion is detected",
+    default=5)
+parser.add_argument(
+    "-pt",
+    "--pass_through",
+    action='store_true',
+    help="record the compressed source stream directly (no re-encoding)")
 args = parser.parse_args()
 
+# pass-through recording is only possible if no stage modifies the frames
+# (or needs them decoded)
+
+if (args.pass_through and ((args.rescale != 1.0) or (args.motion)
+                           or (args.segment > 0) or (args.segment_mb > 0)
+                           or (args.asynchronous))):
+    print("INFO: frames are processed - pass-through recording disabled")
+    args.pass_through = False
+
 video_width = 640
 video_height = 480
 
@@ -49,10 +109,15 @@ video_height = 480
 # define video capture object
 
 try:
-    # to use a non-buffered camera stream (via a separate thread)
+    # to use a non-buffered camera stream (via a separate thread) - except
+    # for pass-through recording, which must read every compressed frame in
+    # order (which the threaded stream, returning the latest frame, does not)
 
     import camera_stream
-    cap = camera_stream.CameraVideoStream(use_tapi=False)
+    if (args.pass_through):
+        cap = cv2.VideoCapture()
+    else:
+        cap = camera_stream.CameraVideoStream(use_tapi=False)
 
 except BaseException:
     # if not then just use OpenCV default
@@ -67,8 +132,28 @@ window_name = "Live Camera Input -> Video File"  # window name
 # define video writer (video: 640 x 480 @ 25 fps)
 
 fourcc = cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')
-output = cv2.VideoWriter('output.avi', fourcc, 25.0,
-                         (video_width, video_height))
+if (args.motion):
+    output = video_writer.RollingVideoRecorder(
+        'clip_{:04d}.avi', fourcc, 25.0, (video_width, video_height),
+        segment_seconds=args.segment,
+        segment_bytes=int(args.segment_mb * 1000000), triggered=True,
+        pre_roll_seconds=args.pre_roll, post_roll_seconds=args.pre_roll,
+        asynchronous=args.asynchronous, max_queue=args.queue)
+    detector = motion_detection.MotionDetector(method="average", scale=0.25)
+    trigger = False
+elif ((args.segment > 0) or (args.segment_mb > 0)):
+    output = video_writer.RollingVideoRecorder(
+        'output_{:04d}.avi', fourcc, 25.0, (video_width, video_height),
+        segment_seconds=args.segment,
+        segment_bytes=int(args.segment_mb * 1000000),
+        asynchronous=args.asynchronous, max_queue=args.queue)
+elif (args.asynchronous):
+    output = video_writer.AsyncVideoWriter('output.avi', fourcc, 25.0,
+                                           (video_width, video_height),
+                                           max_queue=args.queue)
+elif not (args.pass_through):
+    output = cv2.VideoWriter('output.avi', fourcc, 25.0,
+                             (video_width, video_height))
 
 # if command line arguments are provided try to read video_file
 # otherwise default to capture from attached H/W camera
@@ -79,6 +164,22 @@ if ((cap.open("input.avi")) or (cap.open(args.camera_to_use))):
 
     cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
 
+    # set up pass-through recording (as supported by the source) - with
+    # compressed frames then read and written as is, or fall back to
+    # decoding / re-encoding
+
+    if (args.pass_through):
+        codec = video_writer.enable_pass_through(cap)
+        if (codec is not None):
+            output = video_writer.PassThroughWriter('output', codec, cap)
+            print("INFO: pass-through recording (" + codec + ") to "
+                  + output.filename)
+        else:
+            print("INFO: pass-through not supported by source - re-encoding")
+            args.pass_through = False
+            output = cv2.VideoWriter('output.avi', fourcc, 25.0,
+                                     (video_width, video_height))
+
     while (keep_processing):
 
         # if video file or camera successfully open then read frame from video
@@ -98,20 +199,49 @@ if ((cap.open("input.avi")) or (cap.open(args.camera_to_use))):
                 frame = cv2.resize(
                     frame, (0, 0), fx=args.rescale, fy=args.rescale)
 
-        # *** do any processing here ****
+        # *** do any processing here **** (not in pass-through mode, where
+        # frame is the compressed frame as read)
+
+        # write the frame to file (first resizing - which the asynchronous
+        # writer performs on its own thread)
 
-        # write the frame to file (first resizing)
+        if (args.pass_through):
 
-        frame2 = cv2.resize(
-            frame,
-            (video_width,
-             video_height),
-            interpolation=cv2.INTER_CUBIC)
-        output.write(frame2)
+            # write the compressed frame as is, decoding it for display
+            # only (at reduced resolution) if it is a JPEG
+
+            output.write(frame)
+            if (codec == "MJPG"):
+                frame = cv2.imdecode(frame, cv2.IMREAD_REDUCED_COLOR_2)
+            else:
+                frame = None
+
+        elif (args.motion):
+
+            # record a clip if motion is detected (i.e. any region of motion
+            # larger than 0.1% of the image) or the 't' key was pressed
+
+            motion_mask = detector.apply(frame)
+            trigger = trigger or (len(motion_detection.motion_blobs(
+                motion_mask, min_area=(motion_mask.size // 1000))) > 0)
+            output.write(frame, trigger=trigger)
+            trigger = False
+
+        elif ((args.segment > 0) or (args.segment_mb > 0)
+                or (args.asynchronous)):
+            output.write(frame)
+        else:
+            frame2 = cv2.resize(
+                frame,
+                (video_width,
+                 video_height),
+                interpolation=cv2.INTER_CUBIC)
+            output.write(frame2)
 
         # display image
 
-        cv2.imshow(window_name, frame)
+        if (frame is not None):
+            cv2.imshow(window_name, frame)
 
         # start the event loop - essential
 
@@ -128,15 +258,28 @@ if ((cap.open("input.avi")) or (cap.open(args.camera_to_use))):
 
         if (key == ord('x')):
             keep_processing = False
+        elif (key == ord('t')):
+            trigger = True
 
     # close all windows
 
     cv2.destroyAllWindows()
 
-    # Release everything if job is finished
+    # Release everything if job is finished (writing any frames still
+    # queued for asynchronous writing)
     cap.release()
     output.release()
 
+    if (args.motion) or (args.segment > 0) or (args.segment_mb > 0):
+        print("INFO: files written - " + str(output.files))
+    elif (args.pass_through):
+        print("INFO: frames written - " + str(output.written)
+              + ", bytes - " + str(output.bytes))
+    elif (args.asynchronous):
+        print("INFO: frames written - " + str(output.written)
+              + ", dropped - " + str(output.dropped)
+              + ", max. queue depth - " + str(output.max_depth))
+
 else:
     print("No video file specified or camera connected.")
 
@@ -11,6 +11,49 @@
 #####################################################################
 
 import cv2
+import argparse
+import sys
+import batch_images
+import smoothing
+
+#####################################################################
+
+# parse command line arguments for an (optional) directory tree of images
+# to process in batch
+
+parser = argparse.ArgumentParser(
+    description='Perform ' +
+    sys.argv[0] +
+    ' example operation on an image file (or in batch on a directory tree)')
+parser.add_argument(
+    "-b",
+    "--batch_dir",
+    type=str,
+    help="specify optional directory of images to process in batch",
+    default=None)
+parser.add_argument(
+    "-o",
+    "--output_dir",
+    type=str,
+    help="specify batch output directory (default: smoothed)",
+    default='smoothed')
+
+# (any other arguments, as passed to all examples by test_all.sh, are
+# ignored - as before)
+
+args, _ = parser.parse_known_args()
+
+#####################################################################
+
+# batch processing - smooth every image in the directory tree via a pool
+# of workers
+
+if (args.batch_dir):
+    processed, skipped, failed = batch_images.run_batch(
+        args.batch_dir, args.output_dir, "smooth")
+    print("INFO: processed - " + str(processed) + ", skipped - "
+          + str(skipped) + ", failed - " + str(failed))
+    sys.exit(0)
 
 #####################################################################
 
@@ -27,9 +70,10 @@ img = cv2.imread('example.jpg', cv2.IMREAD_COLOR)
 if img is not None:
 
     # performing smoothing on the image using a 5x5 smoothing mark (see manual
-    # entry for GaussianBlur())
+    # entry for GaussianBlur()) - here via a cached separable Gaussian kernel
+    # applied as two 1D filters (see smoothing.py)
 
-    blur = cv2.GaussianBlur(img, (5, 5), 0)
+    blur = smoothing.gaussian_blur(img, (5, 5), 0)
 
     # display this blurred image in a named window
 
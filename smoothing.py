@@ -0,0 +1,145 @@
+##########################################################################
+
+# Gaussian smoothing via cached separable 1D kernels (applied using
+# cv2.sepFilter2D()) and via a recursive (IIR) Gaussian filter whose cost
+# is independent of sigma (for very large blurs on large images)
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+# Ref: Young and van Vliet, "Recursive implementation of the Gaussian
+# filter", Signal Processing, 44(2), 1995.
+
+##########################################################################
+
+# suggested basic usage - as a drop in for cv2.GaussianBlur() as per the
+# examples in smooth_image.py and bilateral_filter.py:
+
+#    import smoothing
+#    ....
+#    blur = smoothing.gaussian_blur(img, (5, 5), 0)
+#    ....
+#    blur = smoothing.recursive_gaussian_blur(img, 50)   # sigma = 50
+
+##########################################################################
+
+import cv2
+import functools
+import numpy as np
+
+##########################################################################
+
+# return the (cached, read-only) 1D Gaussian kernel for a given kernel size
+# and sigma - as per cv2.getGaussianKernel() (including ksize / sigma
+# derivation by cv2.GaussianBlur() when either is <= 0)
+
+
+@functools.lru_cache(maxsize=64)
+def gaussian_kernel(ksize, sigma, depth=cv2.CV_32F):
+
+    if (ksize <= 0):
+        ksize = max(1, int(round(sigma * (3 if depth == cv2.CV_8U else 4)
+                                 * 2 + 1)) | 1)
+
+    kernel = cv2.getGaussianKernel(ksize, sigma, cv2.CV_32F)
+    kernel.setflags(write=False)
+    return kernel
+
+##########################################################################
+
+# Gaussian smoothing of img with kernel size ksize = (width, height) and
+# standard deviations sigma_x, sigma_y - as per cv2.GaussianBlur()
+
+
+def gaussian_blur(img, ksize, sigma_x, sigma_y=0,
+                  border_type=cv2.BORDER_DEFAULT):
+
+    if (sigma_y <= 0):
+        sigma_y = sigma_x
+
+    depth = cv2.CV_8U if (img.dtype == np.uint8) else cv2.CV_32F
+    kernel_x = gaussian_kernel(int(ksize[0]), float(sigma_x), depth)
+    kernel_y = gaussian_kernel(int(ksize[1]), float(sigma_y), depth)
+
+    return cv2.sepFilter2D(img, -1, kernel_x, kernel_y,
+                           borderType=border_type)
+
+##########################################################################
+
+# return the (cached) Young / van Vliet recursive filter coefficients
+# (B, b1 / b0, b2 / b0, b3 / b0) for a given sigma (>= 0.5)
+
+
+@functools.lru_cache(maxsize=64)
+def recursive_gaussian_coefficients(sigma):
+
+    if (sigma >= 2.5):
+        q = (0.98711 * sigma) - 0.96330
+    else:
+        q = 3.97156 - (4.14554 * np.sqrt(1 - (0.26891 * sigma)))
+
+    b0 = 1.57825 + (2.44413 * q) + (1.4281 * q ** 2) + (0.422205 * q ** 3)
+    b1 = (2.44413 * q) + (2.85619 * q ** 2) + (1.26661 * q ** 3)
+    b2 = -((1.4281 * q ** 2) + (1.26661 * q ** 3))
+    b3 = 0.422205 * q ** 3
+
+    return (1 - ((b1 + b2 + b3) / b0), b1 / b0, b2 / b0, b3 / b0)
+
+##########################################################################
+
+# apply the recursive Gaussian filter along the first axis of data, as a
+# causal (forward) pass followed by an anti-causal (backward) pass, each
+# vectorised over all of the other axes (edges replicated)
+
+
+def recursive_gaussian_axis(data, sigma):
+
+    B, a1, a2, a3 = recursive_gaussian_coefficients(sigma)
+    length = data.shape[0]
+
+    # forward pass
+
+    forward = np.empty_like(data)
+    w1 = w2 = w3 = data[0]
+    for n in range(length):
+        forward[n] = (B * data[n]) + (a1 * w1) + (a2 * w2) + (a3 * w3)
+        w3, w2, w1 = w2, w1, forward[n]
+
+    # backward pass (in place)
+
+    y1 = y2 = y3 = forward[length - 1].copy()
+    for n in range(length - 1, -1, -1):
+        forward[n] = (B * forward[n]) + (a1 * y1) + (a2 * y2) + (a3 * y3)
+        y3, y2, y1 = y2, y1, forward[n]
+
+    return forward
+
+##########################################################################
+
+# Gaussian smoothing of img (grey-scale or colour) with standard deviations
+# sigma_x, sigma_y via the recursive filter - a fixed number of operations
+# per pixel irrespective of sigma (an approximation, best for sigma >= 2)
+
+
+def recursive_gaussian_blur(img, sigma_x, sigma_y=0):
+
+    if (sigma_y <= 0):
+        sigma_y = sigma_x
+
+    blurred = img.astype(np.float32)
+
+    # along the image columns (vertical) then the image rows (horizontal)
+
+    blurred = recursive_gaussian_axis(blurred, max(0.5, float(sigma_y)))
+    blurred = recursive_gaussian_axis(
+        blurred.swapaxes(0, 1), max(0.5, float(sigma_x))).swapaxes(0, 1)
+
+    if (np.issubdtype(img.dtype, np.integer)):
+        info = np.iinfo(img.dtype)
+        blurred = np.clip(np.rint(blurred), info.min, info.max)
+    return np.ascontiguousarray(blurred.astype(img.dtype))
+
+##########################################################################
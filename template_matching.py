@@ -0,0 +1,532 @@
+##########################################################################
+
+# fast template matching - coarse to fine search over a Gaussian image
+# pyramid (full search only at the coarsest level, refinement within a
+# small window at each finer level) with optional search over a set of
+# template scales
+
+# + tracking by matching - searching only a window around the previous
+# match (sized from its estimated velocity), falling back to a full frame
+# search only when the match score drops below a confidence threshold
+
+# + normalised cross correlation via the FFT with a cached template spectrum
+# (one forward FFT per frame channel, one multiply and one inverse FFT per
+# frame) with normalisation via box filters, used automatically in
+# place of spatial matching for large templates
+
+# + a bank of templates (for multiple templates / targets) that computes
+# the frame spectrum once per frame and reuses it against every cached
+# template spectrum, returning the peaks for each after non-maximum
+# suppression
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as per example in
+# correlation_template_matching.py:
+
+#    import template_matching
+#    ....
+#    max_val, max_loc = template_matching.pyramid_match(frame, crop)
+#    ....
+#    max_val, max_loc, scale, (w, h) = template_matching.multi_scale_match(
+#                                          frame, crop, (0.8, 1.0, 1.25))
+#    ....
+#    tracker = template_matching.TemplateTracker(crop, threshold=0.6)
+#    ....
+#    max_val, max_loc, found = tracker.track(frame)   # for each frame
+#    ....
+#    correlator = template_matching.FFTCorrelator(crop)
+#    ....
+#    correlation = correlator.match(frame)   # as cv2.TM_CCOEFF_NORMED
+#    ....
+#    bank = template_matching.TemplateBank(threshold=0.7)
+#    template_id = bank.add(crop)            # and bank.remove(template_id)
+#    ....
+#    for (template_id, max_val, (x, y, w, h)) in bank.match(frame): ....
+
+# N.B. as the best match is taken as the maximum of the matching result,
+# methods for which the best match is the minimum (cv2.TM_SQDIFF and
+# cv2.TM_SQDIFF_NORMED) are not supported
+
+##########################################################################
+
+import cv2
+import math
+import numpy as np
+
+##########################################################################
+
+# smallest template dimension (in pixels) permitted at the coarsest level
+
+min_template_size = 8
+
+# template area (in pixels) at and above which FFTCorrelator uses the FFT
+# (as measured, the FFT is faster than cv2.matchTemplate() from ~48 x 48 at
+# both 640 x 480 and 1920 x 1080 frame sizes)
+
+fft_min_template_area = 48 * 48
+
+##########################################################################
+
+# perform template matching of template within frame (the frame region
+# given by x, y, w, h or the whole frame if None), returning the maximum
+# value and its location (top left of the match) in frame coordinates
+
+
+def match_region(frame, template, region=None,
+                 method=cv2.TM_CCOEFF_NORMED):
+
+    offset_x, offset_y = 0, 0
+    if region is not None:
+        x, y, w, h = region
+        offset_x, offset_y = max(0, x), max(0, y)
+        frame = frame[offset_y:y + h, offset_x:x + w]
+
+    th, tw = template.shape[:2]
+    if (frame.shape[0] < th) or (frame.shape[1] < tw):
+        return (-1.0, None)
+
+    result = cv2.matchTemplate(frame, template, method)
+    _, max_val, _, max_loc = cv2.minMaxLoc(result)
+    return (max_val, (max_loc[0] + offset_x, max_loc[1] + offset_y))
+
+##########################################################################
+
+# coarse to fine template matching over a Gaussian image pyramid of up to
+# levels levels (fewer if the template becomes too small), refining the
+# match within +/- margin pixels at each finer level - returns the maximum
+# value and its location (top left of the match) at full resolution
+
+
+def pyramid_match(frame, template, levels=2, margin=4,
+                  method=cv2.TM_CCOEFF_NORMED):
+
+    frames = [frame]
+    templates = [template]
+    for _ in range(levels):
+        if (min(templates[-1].shape[:2]) < (2 * min_template_size)):
+            break
+        frames.append(cv2.pyrDown(frames[-1]))
+        templates.append(cv2.pyrDown(templates[-1]))
+
+    # full search at the coarsest level only
+
+    max_val, max_loc = match_region(frames[-1], templates[-1],
+                                    method=method)
+
+    # refine within a small window around the match at each finer level
+
+    for level in range(len(frames) - 2, -1, -1):
+        if max_loc is None:
+            break
+        th, tw = templates[level].shape[:2]
+        x, y = (2 * max_loc[0]) - margin, (2 * max_loc[1]) - margin
+        max_val, max_loc = match_region(
+            frames[level], templates[level],
+            (x, y, tw + (2 * margin), th + (2 * margin)), method)
+
+    return (max_val, max_loc)
+
+##########################################################################
+
+# template matching over a set of template scales (each via pyramid_match)
+# - returns the maximum value, its location (top left of the match), the
+# template scale and the size (w, h) of the template at that scale
+
+
+def multi_scale_match(frame, template, scales=(1.0,), levels=2, margin=4,
+                      method=cv2.TM_CCOEFF_NORMED):
+
+    best = (-1.0, None, 1.0, (template.shape[1], template.shape[0]))
+
+    for scale in scales:
+        w = int(round(template.shape[1] * scale))
+        h = int(round(template.shape[0] * scale))
+        if (w < 1) or (h < 1) or (w > frame.shape[1]) or (
+                h > frame.shape[0]):
+            continue
+
+        if (scale != 1.0):
+            scaled = cv2.resize(template, (w, h),
+                                interpolation=cv2.INTER_AREA)
+        else:
+            scaled = template
+
+        max_val, max_loc = pyramid_match(frame, scaled, levels, margin,
+                                         method)
+        if (max_loc is not None) and (max_val > best[0]):
+            best = (max_val, max_loc, scale, (w, h))
+
+    return best
+
+##########################################################################
+
+# tracking by matching - the template is searched for within a window
+# around its predicted location (previous location + estimated velocity),
+# enlarged by the speed of the target plus a fixed margin, such that the
+# per-frame cost is independent of the frame size in the steady state
+
+
+class TemplateTracker:
+    def __init__(self, template, threshold=0.6, margin=16,
+                 method=cv2.TM_CCOEFF_NORMED, full_search=None):
+
+        self.template = template
+        self.threshold = threshold
+        self.margin = margin
+        self.method = method
+
+        # function (frame, template) -> (max_val, max_loc) used to search
+        # the full frame, on start up or if the target is lost
+
+        if full_search is None:
+            self.full_search = lambda frame, template: match_region(
+                frame, template, method=self.method)
+        else:
+            self.full_search = full_search
+
+        # last known location (top left), estimated velocity (pixels per
+        # frame) and a count of the full frame searches performed
+
+        self.location = None
+        self.velocity = (0.0, 0.0)
+        self.full_searches = 0
+
+    def track(self, frame):
+
+        # returns the maximum value, its location (top left of the match)
+        # and whether it is above the confidence threshold
+
+        max_val, max_loc = (-1.0, None)
+
+        if self.location is not None:
+
+            # search window around the predicted location
+
+            vx, vy = self.velocity
+            px = int(round(self.location[0] + vx))
+            py = int(round(self.location[1] + vy))
+            mx = self.margin + int(math.ceil(abs(vx)))
+            my = self.margin + int(math.ceil(abs(vy)))
+            th, tw = self.template.shape[:2]
+
+            max_val, max_loc = match_region(
+                frame, self.template,
+                (px - mx, py - my, tw + (2 * mx), th + (2 * my)),
+                self.method)
+
+        # fall back to a full frame search on start up or low confidence
+
+        if (max_loc is None) or (max_val < self.threshold):
+            self.full_searches += 1
+            max_val, max_loc = self.full_search(frame, self.template)
+
+        found = (max_loc is not None) and (max_val >= self.threshold)
+
+        if found:
+
+            # update the velocity estimate (smoothed over recent frames)
+
+            if self.location is not None:
+                self.velocity = (
+                    (0.5 * self.velocity[0])
+                    + (0.5 * (max_loc[0] - self.location[0])),
+                    (0.5 * self.velocity[1])
+                    + (0.5 * (max_loc[1] - self.location[1])))
+            self.location = max_loc
+        else:
+
+            # lost - search the full frame again next time
+
+            self.location = None
+            self.velocity = (0.0, 0.0)
+
+        return (max_val, max_loc, found)
+
+##########################################################################
+
+# DFT size (rows, cols) used for correlating with frames of a given shape
+
+
+def optimal_dft_size(frame_shape):
+    return (cv2.getOptimalDFTSize(frame_shape[0]),
+            cv2.getOptimalDFTSize(frame_shape[1]))
+
+##########################################################################
+
+# forward DFT of each channel of an image, zero padded to dft_size (in the
+# packed CCS format of the spectrum of a real image, as half the size)
+
+
+def image_spectra(image, dft_size):
+
+    values = image.astype(np.float32).reshape(
+        image.shape[0], image.shape[1], -1)
+
+    spectra = []
+    for c in range(values.shape[2]):
+        padded = np.zeros(dft_size, np.float32)
+        padded[:image.shape[0], :image.shape[1]] = values[:, :, c]
+        spectra.append(cv2.dft(padded, nonzeroRows=image.shape[0]))
+    return spectra
+
+##########################################################################
+
+# the energy (sum of squared deviations from the window mean, summed over
+# the channels) of every th x tw window of an image - from its window sums
+# and squared sums via (un-normalised) box filters, anchored at the top left
+# of each window, in float32 (each accumulated in double precision)
+
+
+def window_energy(image, th, tw):
+
+    rh, rw = (image.shape[0] - th + 1), (image.shape[1] - tw + 1)
+
+    sums = cv2.boxFilter(image, cv2.CV_32F, (tw, th), anchor=(0, 0),
+                         normalize=False, borderType=cv2.BORDER_CONSTANT)
+    sq_sums = cv2.sqrBoxFilter(image, cv2.CV_32F, (tw, th), anchor=(0, 0),
+                               normalize=False,
+                               borderType=cv2.BORDER_CONSTANT)
+    energy = cv2.subtract(sq_sums, cv2.multiply(sums, sums,
+                                                scale=(1.0 / (th * tw))))
+    energy = energy[:rh, :rw]
+    if (len(energy.shape) == 3):
+        energy = cv2.transform(energy,
+                               np.ones((1, energy.shape[2]), np.float32))
+    return np.maximum(energy, 0, out=energy)
+
+##########################################################################
+
+# normalised cross correlation (as per cv2.matchTemplate() with method
+# cv2.TM_CCOEFF_NORMED) via the FFT - the spectrum of the zero mean
+# template is computed once (per frame size) and cached, such that
+# correlating each frame requires only the forward FFT of the frame, a
+# multiplication and an inverse FFT, with the local frame statistics for
+# the normalisation obtained from box filters
+
+# (for small templates, spatial matching via cv2.matchTemplate() is faster
+# and is used instead - as set by fft_min_area)
+
+
+class FFTCorrelator:
+    def __init__(self, template, fft_min_area=None):
+
+        self.template = template
+        th, tw = template.shape[:2]
+        if fft_min_area is None:
+            fft_min_area = fft_min_template_area
+        self.use_fft = (th * tw) >= fft_min_area
+
+        # zero mean template (per channel) and its sum of squares
+
+        values = template.astype(np.float32).reshape(th, tw, -1)
+        self.zero_mean = values - values.mean(axis=(0, 1))
+        self.template_energy = float((self.zero_mean ** 2).sum())
+
+        # cached template spectra, for the frame shape they were computed
+        # for
+
+        self.frame_shape = None
+        self.dft_size = None
+        self.spectra = None
+
+    def template_spectra(self, dft_size):
+
+        # return the spectra of the zero mean template, zero padded to
+        # dft_size (at least the frame size, such that the circular
+        # correlation is identical to the linear one for all valid match
+        # positions)
+
+        return image_spectra(self.zero_mean, dft_size)
+
+    def prepare(self, frame_shape):
+
+        # compute and cache the template spectra for this frame
+        # size (using the optimal DFT size for the frame)
+
+        self.frame_shape = frame_shape
+        self.dft_size = optimal_dft_size(frame_shape)
+        self.spectra = self.template_spectra(self.dft_size)
+
+    def correlate_spectrum(self, frame_spectra, spectra=None):
+
+        # return the (un-normalised) cross correlation of the frame (given
+        # as per channel spectra) with the zero mean template (given as per
+        # channel spectra, or as cached by prepare()) - multiplying by the
+        # conjugate of the template spectra
+
+        if spectra is None:
+            spectra = self.spectra
+
+        product = None
+        for frame_spectrum, spectrum in zip(frame_spectra, spectra):
+            channel = cv2.mulSpectrums(frame_spectrum, spectrum, 0,
+                                       conjB=True)
+            product = channel if product is None else product + channel
+
+        return cv2.idft(product, flags=(cv2.DFT_REAL_OUTPUT
+                                        | cv2.DFT_SCALE))
+
+    def normalise(self, frame, correlation, energy=None):
+
+        # normalise the correlation by the local frame energy (from window
+        # sums, which are computed if not given) and the template energy
+
+        th, tw = self.template.shape[:2]
+        if energy is None:
+            energy = window_energy(frame, th, tw)
+
+        rh, rw = energy.shape
+        denominator = cv2.sqrt(cv2.multiply(energy, self.template_energy))
+
+        result = np.zeros((rh, rw), np.float32)
+        np.divide(correlation[:rh, :rw], denominator, out=result,
+                  where=(denominator > (1e-6 * max(1.0,
+                                                   self.template_energy))))
+        return np.clip(result, -1, 1, out=result)
+
+    def match(self, frame, use_fft=None):
+
+        # return the correlation result for frame (as per cv2.matchTemplate()
+        # with cv2.TM_CCOEFF_NORMED) via the FFT or spatially, as set by the
+        # template size unless specified (use_fft)
+
+        if use_fft is None:
+            use_fft = self.use_fft
+        if not (use_fft):
+            return cv2.matchTemplate(frame, self.template,
+                                     cv2.TM_CCOEFF_NORMED)
+
+        if (frame.shape != self.frame_shape):
+            self.prepare(frame.shape)
+
+        frame_spectra = image_spectra(frame, self.dft_size)
+        return self.normalise(frame, self.correlate_spectrum(frame_spectra))
+
+##########################################################################
+
+# greedy non-maximum suppression of detections [(score, (x, y, w, h)), ...]
+# - keeps the highest scoring detections, discarding any that overlap an
+# already kept one by more than overlap (intersection over union)
+
+
+def non_maximum_suppression(detections, overlap=0.3):
+
+    kept = []
+    for score, (x, y, w, h) in sorted(detections, key=lambda d: -d[0]):
+        for _, (kx, ky, kw, kh) in kept:
+            iw = min(x + w, kx + kw) - max(x, kx)
+            ih = min(y + h, ky + kh) - max(y, ky)
+            if (iw > 0) and (ih > 0):
+                intersection = iw * ih
+                union = (w * h) + (kw * kh) - intersection
+                if (intersection / union) > overlap:
+                    break
+        else:
+            kept.append((score, (x, y, w, h)))
+    return kept
+
+##########################################################################
+
+# a bank of templates matched against each frame via the FFT - the frame
+# spectrum is computed once per frame (and the local frame energy once per
+# template size) and shared by every template, such that each additional
+# template costs only the forward FFT of the (zero padded) template, a
+# multiplication, an inverse FFT and the peak search - with no frame sized
+# spectra held per template, such that memory does not grow with the
+# number of templates
+
+
+class TemplateBank:
+    def __init__(self, threshold=0.7, max_peaks=10, overlap=0.3):
+
+        # minimum correlation of a peak, maximum number of peaks returned
+        # per template and the non-maximum suppression overlap
+
+        self.threshold = threshold
+        self.max_peaks = max_peaks
+        self.overlap = overlap
+
+        # correlators (one per template) by template id
+
+        self.correlators = {}
+        self.next_id = 0
+
+    def add(self, template):
+
+        # add a template to the bank, returning its id
+
+        self.correlators[self.next_id] = FFTCorrelator(template,
+                                                       fft_min_area=0)
+        self.next_id += 1
+        return self.next_id - 1
+
+    def remove(self, template_id):
+        self.correlators.pop(template_id, None)
+
+    def clear(self):
+        self.correlators.clear()
+
+    def __len__(self):
+        return len(self.correlators)
+
+    def peaks(self, correlation, w, h):
+
+        # local maxima of the correlation above the threshold (strongest
+        # first), as detections [(score, (x, y, w, h)), ...] after
+        # non-maximum suppression
+
+        local_max = cv2.dilate(correlation, np.ones((3, 3), np.uint8))
+        ys, xs = np.nonzero((correlation >= local_max)
+                            & (correlation >= self.threshold))
+        scores = correlation[ys, xs]
+        order = np.argsort(-scores)[:(self.max_peaks * 10)]
+
+        detections = [(float(scores[i]), (int(xs[i]), int(ys[i]), w, h))
+                      for i in order]
+        return non_maximum_suppression(
+            detections, self.overlap)[:self.max_peaks]
+
+    def match(self, frame):
+
+        # return a list of detections (template_id, score, (x, y, w, h))
+        # for all of the templates in the bank
+
+        detections = []
+        if not (self.correlators):
+            return detections
+
+        # shared per frame - frame spectra
+
+        dft_size = optimal_dft_size(frame.shape)
+        frame_spectra = image_spectra(frame, dft_size)
+
+        # local frame energy, shared by all templates of the same size
+
+        energies = {}
+
+        for template_id, correlator in self.correlators.items():
+            th, tw = correlator.template.shape[:2]
+            if (th > frame.shape[0]) or (tw > frame.shape[1]):
+                continue
+
+            if (th, tw) not in energies:
+                energies[(th, tw)] = window_energy(frame, th, tw)
+
+            correlation = correlator.normalise(
+                frame, correlator.correlate_spectrum(
+                    frame_spectra, correlator.template_spectra(dft_size)),
+                energy=energies[(th, tw)])
+
+            detections += [(template_id, score, box) for score, box
+                           in self.peaks(correlation, tw, th)]
+
+        return detections
+
+##########################################################################
@@ -0,0 +1,294 @@
+##########################################################################
+
+# frame accurate random access to (compressed) video files via an index of
+# the keyframe positions and frame timestamps of the file - built by a
+# single scan of the file (reading its packets without decoding them where
+# the FFmpeg backend permits) and stored in a sidecar index file
+
+# seeking is then only ever performed to a keyframe (which is accurate),
+# followed by decoding forward to the required frame, such that arbitrary
+# frames and frame ranges can be fetched efficiently
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage:
+
+#    import video_index
+#    reader = video_index.IndexedVideoReader("video.mp4")  # (re)builds
+#    ....                                                 # index if needed
+#    ret, frame = reader.read(1234)                  # frame 1234
+#    ....
+#    for (frame_number, frame) in reader.frames(5000, 5100, step=2):
+#        ....
+#    reader.release()
+
+# or build / update the index file (video.mp4.index.json) in advance via:
+
+#    python3 video_index.py video.mp4
+
+##########################################################################
+
+import cv2
+import bisect
+import json
+import os
+import sys
+
+##########################################################################
+
+# sidecar index file suffix (appended to the video filename)
+
+index_suffix = ".index.json"
+
+##########################################################################
+
+# scan the video file, returning its index - the frame rate, number of
+# frames, keyframe frame numbers and frame timestamps (ms.) in presentation
+# order, and the file size and modification time (to check that the index
+# is still valid for the file)
+
+
+def build_index(filename):
+
+    cap = cv2.VideoCapture(filename, cv2.CAP_FFMPEG)
+    if not (cap.isOpened()):
+        raise IOError("build_index: cannot open video file " + filename)
+
+    # read the packets of the file without decoding them if possible (raw
+    # mode) or otherwise decode each frame to get its type
+
+    raw = cap.set(cv2.CAP_PROP_FORMAT, -1)
+
+    timestamps = []
+    keys = []
+    while (cap.grab()):
+        timestamps.append(cap.get(cv2.CAP_PROP_POS_MSEC))
+        if (raw):
+            keys.append(cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME) > 0)
+        else:
+            keys.append(int(cap.get(cv2.CAP_PROP_FRAME_TYPE)) == ord("I"))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    cap.release()
+
+    # packets are in decode order, which differs from presentation order
+    # where there are B-frames, so frame numbers (presentation order) are
+    # given by the rank of each (presentation) timestamp
+
+    ordered = sorted(timestamps)
+    keyframes = sorted(bisect.bisect_left(ordered, t)
+                       for (t, key) in zip(timestamps, keys) if key)
+    if (len(keyframes) == 0) or (keyframes[0] != 0):
+        keyframes.insert(0, 0)
+
+    status = os.stat(filename)
+    return {"video": os.path.basename(filename),
+            "size": status.st_size,
+            "mtime": status.st_mtime,
+            "fps": fps,
+            "frames": len(ordered),
+            "keyframes": keyframes,
+            "timestamps": ordered}
+
+##########################################################################
+
+
+class VideoIndex:
+    def __init__(self, filename, rebuild=False):
+
+        # load the index from the sidecar index file of the video, if it
+        # exists and is valid for the video, otherwise build and save it
+
+        self.filename = filename
+        self.index_filename = filename + index_suffix
+
+        index = None if (rebuild) else self.load()
+        if index is None:
+            index = build_index(filename)
+            self.save(index)
+
+        self.fps = index["fps"]
+        self.frames = index["frames"]
+        self.keyframes = index["keyframes"]
+        self.timestamps = index["timestamps"]
+
+    def load(self):
+
+        # return the stored index (or None if missing or out of date)
+
+        try:
+            with open(self.index_filename, "r") as index_file:
+                index = json.load(index_file)
+            status = os.stat(self.filename)
+            if ((index["size"] == status.st_size)
+                    and (index["mtime"] == status.st_mtime)):
+                return index
+        except (IOError, ValueError, KeyError):
+            pass
+        return None
+
+    def save(self, index):
+
+        # write the index file atomically (via a temporary file) so that a
+        # partially written index is never read
+
+        temporary = self.index_filename + ".tmp"
+        try:
+            with open(temporary, "w") as index_file:
+                json.dump(index, index_file)
+            os.replace(temporary, self.index_filename)
+        except IOError:
+            print("WARNING: cannot write video index file "
+                  + self.index_filename)
+
+    def __len__(self):
+        return self.frames
+
+    def keyframe(self, frame_number):
+
+        # the last keyframe at or before the frame
+
+        return self.keyframes[bisect.bisect_right(self.keyframes,
+                                                  frame_number) - 1]
+
+    def frame_at(self, timestamp):
+
+        # the frame (number) displayed at the timestamp (ms.)
+
+        return max(0, bisect.bisect_right(self.timestamps, timestamp) - 1)
+
+##########################################################################
+
+
+class IndexedVideoReader:
+    def __init__(self, filename, index=None):
+
+        # the video, its index (loaded or built if not given), the number
+        # of the next frame to be returned and whether it has already been
+        # grabbed (but not yet retrieved)
+
+        self.filename = filename
+        self.index = index if (index is not None) else VideoIndex(filename)
+        self.cap = cv2.VideoCapture(filename, cv2.CAP_FFMPEG)
+        self.position = 0
+        self.grabbed = False
+
+        # counts of the seeks performed and frames decoded (for info.)
+
+        self.seeks = 0
+        self.decoded = 0
+
+    def _seek_keyframe(self, keyframe, frame_number):
+
+        # seek to the keyframe by its (indexed) timestamp, then grab the
+        # frame the seek actually landed on and identify it from its
+        # timestamp - retrying from the previous keyframe if this is beyond
+        # frame_number (or from the start of the video, re-opened)
+
+        while True:
+            self.seeks += 1
+            if (keyframe > 0):
+                self.cap.set(cv2.CAP_PROP_POS_MSEC,
+                             self.index.timestamps[keyframe])
+            else:
+                self.cap.open(self.filename, cv2.CAP_FFMPEG)
+
+            if not (self.cap.grab()):
+                self.position = len(self.index)
+                self.grabbed = False
+                return
+
+            # (allowing for rounding of the timestamps in ms.)
+
+            landed = self.index.frame_at(
+                self.cap.get(cv2.CAP_PROP_POS_MSEC) + 0.5)
+            if (landed <= frame_number) or (keyframe == 0):
+                self.position = landed
+                self.grabbed = True
+                self.decoded += 1
+                return
+            keyframe = self.index.keyframe(keyframe - 1)
+
+    def seek(self, frame_number):
+
+        # position the video such that the next frame returned is
+        # frame_number - seeking to the last keyframe before it only if it
+        # is behind the current position or beyond the next keyframe, then
+        # skipping (grab only) forward to it
+
+        frame_number = min(max(0, frame_number), len(self.index))
+        keyframe = self.index.keyframe(frame_number)
+
+        if not (keyframe <= self.position <= frame_number):
+            self._seek_keyframe(keyframe, frame_number)
+
+        while (self.position < frame_number):
+            if (self.grabbed):
+                self.grabbed = False
+            elif not (self.cap.grab()):
+                break
+            else:
+                self.decoded += 1
+            self.position += 1
+
+    def read(self, frame_number=None):
+
+        # return (ret, frame) for the frame (or the next frame if None)
+
+        if frame_number is not None:
+            self.seek(frame_number)
+
+        if (self.grabbed):
+            ret, frame = self.cap.retrieve()
+            self.grabbed = False
+        else:
+            ret, frame = self.cap.read()
+            if (ret):
+                self.decoded += 1
+        if (ret):
+            self.position += 1
+        return (ret, frame)
+
+    def frames(self, start, stop=None, step=1):
+
+        # generate (frame_number, frame) for the frames in range(start,
+        # stop, step) - seeking between frames only where this is quicker
+        # than decoding forward (i.e. across a keyframe)
+
+        if stop is None:
+            stop = len(self.index)
+
+        for frame_number in range(start, min(stop, len(self.index)), step):
+            ret, frame = self.read(frame_number)
+            if not (ret):
+                return
+            yield (frame_number, frame)
+
+    def timestamp(self, frame_number):
+
+        # the timestamp (ms.) of the frame
+
+        return self.index.timestamps[frame_number]
+
+    def release(self):
+        self.cap.release()
+
+##########################################################################
+
+# build (or rebuild) the index files of the videos given on the command line
+
+
+if __name__ == "__main__":
+
+    for filename in sys.argv[1:]:
+        index = VideoIndex(filename, rebuild=True)
+        print(filename + " : " + str(len(index)) + " frames, "
+              + str(len(index.keyframes)) + " keyframes -> "
+              + index.index_filename)
+
+##########################################################################
@@ -0,0 +1,264 @@
+##########################################################################
+
+# parallel processing of (long) video files - the video is split into N
+# segments, each starting at a keyframe, and each segment is processed by
+# its own worker process (with its own cv2.VideoCapture seeked to the start
+# of its segment) with the outputs merged in order - either the processed
+# frames to an output video file or a list of per-frame results (metrics)
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage (from a script with a __main__ guard, as worker
+# processes may re-import it, with function defined at module level):
+
+#    import video_segments
+#
+#    def process(frame):
+#        return cv2.fastNlMeansDenoisingColored(frame, h=10)
+#
+#    if __name__ == "__main__":
+#        video_segments.run_segments("input.mp4", process,
+#                                    output="output.avi")   # frames
+#        ....
+#        results = video_segments.run_segments("input.mp4", metric)
+#                                                # (list of per-frame values)
+
+# or from the command line with one of the processing functions below:
+
+#    python3 video_segments.py -f nlm -w 8 input.mp4 output.avi
+
+##########################################################################
+
+import cv2
+import argparse
+import concurrent.futures
+import os
+import time
+import numpy as np
+import video_index
+
+##########################################################################
+
+# split the frames (of the video with the given index) into (up to) the
+# given number of segments, each starting at a keyframe (such that seeking
+# to its start is both fast and accurate), as a list of (start, stop)
+
+
+def segment_bounds(index, segments):
+
+    starts = sorted(set(index.keyframe((i * len(index)) // segments)
+                        for i in range(segments)))
+    return list(zip(starts, starts[1:] + [len(index)]))
+
+##########################################################################
+
+# process the frames start -> stop of the video (as a worker task) - either
+# writing the processed frames to part_filename, returning the number of
+# frames, or returning the list of per-frame results
+
+
+def process_segment(filename, index, start, stop, function,
+                    part_filename=None, fourcc=None, fps=25.0):
+
+    reader = video_index.IndexedVideoReader(filename, index)
+    writer = None
+    results = []
+
+    for (_, frame) in reader.frames(start, stop):
+        result = function(frame)
+        if part_filename is None:
+            results.append(result)
+            continue
+
+        if writer is None:
+            height, width = result.shape[:2]
+            writer = cv2.VideoWriter(part_filename, fourcc, fps,
+                                     (width, height))
+        writer.write(result)
+        results.append(None)
+
+    reader.release()
+    if writer is not None:
+        writer.release()
+
+    return len(results) if (part_filename is not None) else results
+
+##########################################################################
+
+# process the video file with function (frame -> processed frame, or
+# frame -> any per-frame result) using workers processes (default: one per
+# CPU core) - writing the processed frames to output (if specified) or
+# returning the list of per-frame results
+
+
+def run_segments(filename, function, output=None, workers=None,
+                 segments=None, fourcc=None, fps=None):
+
+    index = video_index.VideoIndex(filename)
+    workers = workers or os.cpu_count() or 1
+    bounds = segment_bounds(index, segments or workers)
+
+    fps = fps or index.fps or 25.0
+    fourcc = fourcc or cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')
+
+    parts = [None] * len(bounds)
+    if output is not None:
+        parts = [output + ".part" + str(i) + ".avi"
+                 for i in range(len(bounds))]
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        jobs = [pool.submit(process_segment, filename, index, start, stop,
+                            function, part, fourcc, fps)
+                for ((start, stop), part) in zip(bounds, parts)]
+
+        # results - concatenated in segment order
+
+        if output is None:
+            results = []
+            for job in jobs:
+                results.extend(job.result())
+            return results
+
+        # frames - written to output in segment order, as each segment is
+        # completed (whilst later segments are still being processed)
+
+        merger = PartMerger(output, fourcc, fps)
+        for (job, part) in zip(jobs, parts):
+            job.result()
+            merger.append(part)
+            os.remove(part)
+        merger.release()
+        return None
+
+##########################################################################
+
+# merges part files (in order) into an output video - copying their
+# compressed frames without decoding / re-encoding where possible (the
+# FFmpeg backend reading / writing packets in raw mode, for intra-frame
+# only MJPG) or otherwise decoding and re-encoding each frame
+
+
+class PartMerger:
+    def __init__(self, output, fourcc, fps):
+
+        self.output = output
+        self.fourcc = fourcc
+        self.fps = fps
+        self.copy = ((fourcc == cv2.VideoWriter_fourcc('M', 'J', 'P', 'G'))
+                     and hasattr(cv2, "VIDEOWRITER_PROP_RAW_VIDEO"))
+        self.writer = None
+        self.frames = 0
+
+    def _open(self, width, height):
+        if (self.copy):
+            self.writer = cv2.VideoWriter(
+                self.output, cv2.CAP_FFMPEG, self.fourcc, self.fps,
+                (width, height), [cv2.VIDEOWRITER_PROP_RAW_VIDEO, 1])
+            if (self.writer.isOpened()):
+                return
+            self.copy = False
+        self.writer = cv2.VideoWriter(self.output, self.fourcc, self.fps,
+                                      (width, height))
+
+    def append(self, part):
+
+        # append the frames of the part file to the output - copying them if
+        # the first part could be read (and the output written) in raw mode
+
+        segment = cv2.VideoCapture(part, cv2.CAP_FFMPEG)
+        raw = (self.copy) and (segment.set(cv2.CAP_PROP_FORMAT, -1))
+        if (self.writer is None):
+            self.copy = raw
+            self._open(int(segment.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                       int(segment.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+
+        if (raw) and not (self.copy):
+            segment.release()
+            segment = cv2.VideoCapture(part)
+        elif (self.copy) and not (raw):
+            raise IOError("PartMerger: cannot read packets of " + part)
+
+        while True:
+            ret, frame = segment.read()
+            if not (ret):
+                break
+            self.writer.write(frame)
+            self.frames += 1
+        segment.release()
+
+    def release(self):
+        if self.writer is not None:
+            self.writer.release()
+
+##########################################################################
+
+# example processing functions (at module level, such that they can be
+# used by worker processes) - returning a processed frame or a metric
+
+
+functions = {
+    "nlm": lambda frame: cv2.fastNlMeansDenoisingColored(frame, h=10),
+    "bilateral": lambda frame: cv2.bilateralFilter(frame, 9, 75, 75),
+    "canny": lambda frame: cv2.cvtColor(
+        cv2.Canny(frame, 50, 150), cv2.COLOR_GRAY2BGR),
+    "brightness": lambda frame: float(np.mean(frame))
+}
+
+
+def apply_function(name, frame):
+    return functions[name](frame)
+
+##########################################################################
+
+# command line usage - process a video file with one of the above functions
+
+
+if __name__ == "__main__":
+
+    import functools
+
+    parser = argparse.ArgumentParser(
+        description='Parallel processing of a video file in segments')
+    parser.add_argument(
+        "-f",
+        "--function",
+        type=str,
+        choices=sorted(functions),
+        help="processing function to apply to each frame",
+        default="nlm")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="number of worker processes (default: one per CPU core)",
+        default=None)
+    parser.add_argument(
+        'video_file',
+        metavar='video_file',
+        type=str,
+        help='specify input video file')
+    parser.add_argument(
+        'output_file',
+        metavar='output_file',
+        type=str,
+        nargs='?',
+        help='specify output video file (or per-frame results are printed)')
+    args = parser.parse_args()
+
+    start_t = time.time()
+    results = run_segments(args.video_file,
+                           functools.partial(apply_function, args.function),
+                           output=args.output_file, workers=args.workers)
+
+    if results is not None:
+        for (frame_number, result) in enumerate(results):
+            print(str(frame_number) + " : " + str(result))
+    print("INFO: processing took " + str(time.time() - start_t) + " s.")
+
+##########################################################################
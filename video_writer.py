@@ -0,0 +1,418 @@
+##########################################################################
+
+# asynchronous video writing - frames are accepted into a bounded queue and
+# resized / encoded on a separate worker thread, such that encoder delays
+# do not hold up (and hence drop frames from) the capture loop
+
+# + segmented (rolling file) recording, rolling to a new file by duration or
+# size, and triggered (event clip) recording that keeps an in-memory
+# pre-roll ring of the last N seconds of (JPEG) encoded frames that are
+# written ahead of the frames that follow each trigger
+
+# + pass-through recording, where frames are not modified, of the compressed
+# stream of the source (its packets, as returned by the FFmpeg backend in
+# raw mode, or camera native MJPG frames) without decoding / re-encoding
+
+# Author : Toby Breckon, toby.breckon@durham.ac.uk
+
+# Copyright (c) 2024 Dept Computer Science,
+#                    Durham University, UK
+# License : LGPL - http://www.gnu.org/licenses/lgpl.html
+
+##########################################################################
+
+# suggested basic usage - as a drop in for cv2.VideoWriter() as per example
+# in save_video.py:
+
+#    import video_writer
+#    fourcc = cv2.VideoWriter_fourcc('M', 'J', 'P', 'G')
+#    output = video_writer.AsyncVideoWriter('output.avi', fourcc, 25.0,
+#                                           (640, 480))
+#    ....
+#    output.write(frame)     # returns False if the frame was dropped
+#    ....
+#    output.release()        # writes all queued frames before returning
+
+# frames of any size are resized to the output frame size on the worker
+# thread - the number of frames awaiting encoding is available via
+# output.queue_depth() and the number dropped (queue full) via
+# output.dropped
+
+# rolling / triggered recording usage - as per example in save_video.py:
+
+#    recorder = video_writer.RollingVideoRecorder(
+#        "clip_{:04d}.avi", fourcc, 25.0, (640, 480), segment_seconds=60,
+#        pre_roll_seconds=5, post_roll_seconds=5, triggered=True)
+#    ....
+#    recorder.write(frame, trigger=motion_detected)
+#    ....
+#    recorder.release()
+#    print(recorder.files)   # list of files written
+
+# pass-through recording usage - as per example in save_video.py:
+
+#    codec = video_writer.enable_pass_through(cap)   # None if unsupported
+#    if codec is not None:
+#        output = video_writer.PassThroughWriter("output", codec, cap)
+#        ....
+#        ret, packet = cap.read()        # compressed frame (1 x N bytes)
+#        output.write(packet)
+#        ....
+#        output.release()
+
+# (the output is an elementary stream, e.g. output.mjpeg, which carries no
+# container level timing - players assume a default frame rate, so use
+# "ffmpeg -r 25 -i output.mjpeg -c copy output.avi" to set it losslessly)
+
+##########################################################################
+
+import cv2
+import collections
+import os
+import queue
+import threading
+
+##########################################################################
+
+# elementary stream file extension for each (source) codec fourcc
+
+stream_extensions = {"MJPG": ".mjpeg", "H264": ".h264", "h264": ".h264",
+                     "avc1": ".h264", "HEVC": ".h265", "hevc": ".h265",
+                     "hev1": ".h265", "hvc1": ".h265", "FMP4": ".m4v",
+                     "mp4v": ".m4v", "XVID": ".m4v", "DIVX": ".m4v"}
+
+##########################################################################
+
+
+class AsyncVideoWriter:
+    def __init__(self, filename, fourcc, fps, frame_size, max_queue=64,
+                 interpolation=cv2.INTER_CUBIC, copy=True):
+
+        # output frame size (width, height), the interpolation used to
+        # resize frames to it and whether frames are copied when queued (as
+        # camera frames may otherwise reside in the same portion of
+        # allocated memory)
+
+        self.frame_size = tuple(frame_size)
+        self.interpolation = interpolation
+        self.copy = copy
+
+        # underlying (synchronous) video writer
+
+        self.writer = cv2.VideoWriter(filename, fourcc, fps, self.frame_size)
+
+        # bounded queue of frames awaiting encoding, counts of frames
+        # written and dropped and the largest queue depth seen
+
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.written = 0
+        self.dropped = 0
+        self.max_depth = 0
+
+        self.thread = threading.Thread(target=self._encode, daemon=True,
+                                       name="AsyncVideoWriter")
+        self.thread.start()
+
+    def _encode(self):
+
+        # resize and encode each frame as it arrives until the end sentinel
+        # (None) is received - first decoding any frame queued JPEG encoded
+
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+
+            frame, encoded = item
+            if (encoded):
+                frame = cv2.imdecode(frame, cv2.IMREAD_COLOR)
+                if frame is None:
+                    continue
+
+            height, width = frame.shape[:2]
+            if ((width, height) != self.frame_size):
+                frame = cv2.resize(frame, self.frame_size,
+                                   interpolation=self.interpolation)
+            self.writer.write(frame)
+            self.written += 1
+
+    def isOpened(self):
+        return self.writer.isOpened() and self.thread.is_alive()
+
+    def write(self, frame):
+
+        # queue the frame for encoding - returning False (and counting it as
+        # dropped) if the queue is full
+
+        return self._put((frame.copy() if self.copy else frame, False))
+
+    def write_encoded(self, buffer):
+
+        # queue a JPEG encoded frame (as per cv2.imencode()), which is
+        # decoded on the worker thread, likewise
+
+        return self._put((buffer, True))
+
+    def _put(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+        self.max_depth = max(self.max_depth, self.queue.qsize())
+        return True
+
+    def queue_depth(self):
+
+        # number of frames currently awaiting encoding
+
+        return self.queue.qsize()
+
+    def release(self):
+
+        # encode all queued frames, then stop the worker thread and release
+        # the underlying writer
+
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        self.writer.release()
+
+    def __del__(self):
+        if self.thread.is_alive():
+            self.queue.put(None)
+
+##########################################################################
+
+# records to a sequence of files (named via filename_format.format(index))
+# rolling to a new file after segment_seconds of video or segment_bytes of
+# output (either 0 = unlimited) - if triggered, frames are only recorded
+# from pre_roll_seconds before a trigger until post_roll_seconds after the
+# last trigger (with each such clip in a new file)
+
+
+class RollingVideoRecorder:
+    def __init__(self, filename_format, fourcc, fps, frame_size,
+                 segment_seconds=60, segment_bytes=0, triggered=False,
+                 pre_roll_seconds=5, post_roll_seconds=5, jpeg_quality=90,
+                 asynchronous=True, max_queue=64):
+
+        self.filename_format = filename_format
+        self.fourcc = fourcc
+        self.fps = fps
+        self.frame_size = tuple(frame_size)
+
+        # (triggered recording is always asynchronous, such that the
+        # pre-roll frames are decoded on the writer thread rather than
+        # stalling capture at the start of each clip)
+
+        self.asynchronous = asynchronous or triggered
+
+        # segment limits (in frames and bytes)
+
+        self.segment_frames = int(round(segment_seconds * fps))
+        self.segment_bytes = segment_bytes
+
+        # triggered recording - pre-roll ring of JPEG encoded frames (as
+        # these are ~10x smaller than the raw frames) and the number of
+        # frames to record after the last trigger
+
+        self.triggered = triggered
+        self.pre_roll = collections.deque(
+            maxlen=max(0, int(round(pre_roll_seconds * fps))))
+        self.post_roll_frames = max(1, int(round(post_roll_seconds * fps)))
+        self.jpeg_params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality]
+        self.remaining = 0
+
+        # (the asynchronous writer queue must also hold the pre-roll frames
+        # written at the start of each clip)
+
+        self.max_queue = max_queue + self.pre_roll.maxlen
+
+        # current writer, its filename and frame count, and the list of all
+        # files written
+
+        self.writer = None
+        self.filename = None
+        self.frames = 0
+        self.files = []
+        self.dropped = 0
+
+    def _open(self):
+
+        # close any current file and open the next one in the sequence
+
+        self._close()
+        self.filename = self.filename_format.format(len(self.files))
+        if (self.asynchronous):
+            self.writer = AsyncVideoWriter(
+                self.filename, self.fourcc, self.fps, self.frame_size,
+                max_queue=self.max_queue)
+        else:
+            self.writer = cv2.VideoWriter(self.filename, self.fourcc,
+                                          self.fps, self.frame_size)
+        self.files.append(self.filename)
+        self.frames = 0
+
+    def _close(self):
+        if self.writer is not None:
+            self.writer.release()
+            if (self.asynchronous):
+                self.dropped += self.writer.dropped
+            self.writer = None
+
+    def _segment_full(self):
+        if (self.segment_frames > 0) and (self.frames >= self.segment_frames):
+            return True
+        return ((self.segment_bytes > 0)
+                and (os.path.getsize(self.filename) >= self.segment_bytes))
+
+    def _write(self, frame, encoded=False):
+
+        # write the frame (or JPEG encoded frame) to the current file
+        # (resized to the output frame size), rolling to a new file if the
+        # current one is full
+
+        if (self.writer is None) or self._segment_full():
+            self._open()
+
+        if (encoded):
+            self.writer.write_encoded(frame)
+            self.frames += 1
+            return
+
+        height, width = frame.shape[:2]
+        if (not (self.asynchronous) and ((width, height) != self.frame_size)):
+            frame = cv2.resize(frame, self.frame_size,
+                               interpolation=cv2.INTER_CUBIC)
+        self.writer.write(frame)
+        self.frames += 1
+
+    def recording(self):
+
+        # whether frames are currently being written to file
+
+        return (not (self.triggered)) or (self.remaining > 0)
+
+    def write(self, frame, trigger=False):
+
+        # record the frame - in triggered mode, a trigger starts a new clip
+        # (beginning with the pre-roll frames) or extends the current one
+
+        if not (self.triggered):
+            self._write(frame)
+            return
+
+        if (trigger):
+            if (self.remaining == 0):
+                self._open()
+                for encoded in self.pre_roll:
+                    self._write(encoded, encoded=True)
+                self.pre_roll.clear()
+            self.remaining = self.post_roll_frames
+
+        if (self.remaining > 0):
+            self._write(frame)
+            self.remaining -= 1
+            if (self.remaining == 0):
+                self._close()
+        elif (self.pre_roll.maxlen > 0):
+            ret, encoded = cv2.imencode(".jpg", frame, self.jpeg_params)
+            if (ret):
+                self.pre_roll.append(encoded)
+
+    def release(self):
+
+        # finish (and close) the current file
+
+        self._close()
+        self.remaining = 0
+
+##########################################################################
+
+
+# return the fourcc code of a capture as a string (e.g. "MJPG")
+
+
+def fourcc_string(cap):
+    code = int(cap.get(cv2.CAP_PROP_FOURCC))
+    return "".join(chr((code >> (8 * i)) & 0xFF) for i in range(4))
+
+##########################################################################
+
+# switch the capture to returning compressed frames - packets of the source
+# stream (FFmpeg backend, video files / network streams) or native MJPG
+# frames (V4L backend, cameras) - returning the codec fourcc string, or None
+# (leaving decoded frames) if neither is supported
+
+# (cap must be a cv2.VideoCapture, as every compressed frame must be read in
+# order - threaded capture wrappers, such as camera_stream.CameraVideoStream,
+# drop or repeat frames)
+
+
+def enable_pass_through(cap):
+
+    if not (isinstance(cap, cv2.VideoCapture)):
+        return None
+
+    if (cap.set(cv2.CAP_PROP_FORMAT, -1)):
+        return fourcc_string(cap)
+
+    if (cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+            and (fourcc_string(cap) == "MJPG")
+            and cap.set(cv2.CAP_PROP_CONVERT_RGB, 0)):
+
+        # (check that frames are in fact returned undecoded)
+
+        ret, frame = cap.read()
+        if (ret) and (frame is not None) and (frame.shape[0] == 1):
+            return "MJPG"
+        cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+
+    return None
+
+##########################################################################
+
+# writes compressed frames (as returned by a capture in pass-through mode)
+# to an elementary stream file named filename_base + the codec extension,
+# starting with any codec extradata (e.g. MPEG-4 / H.264 headers) of the
+# capture
+
+
+class PassThroughWriter:
+    def __init__(self, filename_base, codec, cap=None):
+
+        self.filename = filename_base + stream_extensions.get(codec, ".raw")
+        self.file = open(self.filename, "wb")
+        self.written = 0
+        self.bytes = 0
+
+        # codec extradata (FFmpeg backend only) - only available once the
+        # first packet has been read, so retrieved on the first write (and
+        # only from a cv2.VideoCapture, not from a capture wrapper)
+
+        self.cap = cap if isinstance(cap, cv2.VideoCapture) else None
+
+    def isOpened(self):
+        return not (self.file.closed)
+
+    def write(self, packet):
+
+        if (self.written == 0) and (self.cap is not None):
+            try:
+                ret, extradata = self.cap.retrieve(None, int(self.cap.get(
+                    cv2.CAP_PROP_CODEC_EXTRADATA_INDEX)))
+                if (ret) and (extradata is not None) and (extradata.size > 0):
+                    self.file.write(extradata.tobytes())
+            except (cv2.error, AttributeError, TypeError):
+                pass
+
+        self.file.write(packet.tobytes())
+        self.written += 1
+        self.bytes += packet.size
+
+    def release(self):
+        self.file.close()
+
+##########################################################################